@@ -0,0 +1,231 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' Module provides analysis of executed trajectories recorded by CRS_sampler. '''
+
+import numpy as np
+
+
+class SplinePath(object):
+    """
+    Planned spline trajectory, evaluated vectorized at arbitrary times.
+    """
+
+    def __init__(self, params, order, min_times, start, speed=None):
+        """
+        SplinePath constructor.
+        :param params: Parameters of spline segments, one row per segment.
+        :param order: Order of spline.
+        :param min_times: Minimal time of segments (ms), scalar or one per segment, 0 for untimed segments.
+        :param start: Start position of trajectory (IRC).
+        :param speed: Axis speed limits (IRC/ms), scalar or one per axis, see Commander.coord_speed.
+                      Segment lasts its minimal time or time given by speed limits, whichever
+                      is longer, as in the control unit. Required for untimed segments.
+        """
+        params = np.asarray(params, dtype=float)
+        n = len(params)
+        self.order = order
+        self.coef = params.reshape(n, -1, order)               # (segment, axis, power)
+        durations = np.broadcast_to(np.asarray(min_times, dtype=float), (n,))
+        if speed is not None:
+            durations = np.maximum(durations, np.max(np.abs(self.coef.sum(axis=2)) / speed, axis=1))
+        self.durations = durations / 1000.0
+        # segments ending at their start position are finished instantly
+        untimed = ~(self.durations > 0) & np.any(self.coef.sum(axis=2) != 0, axis=1)
+        if np.any(untimed):
+            raise ValueError('Segment %d has no duration, minimal times or axis speed limits are required.'
+                             % np.argmax(untimed))
+        self.bounds = np.concatenate(([0.0], np.cumsum(self.durations)))
+        self.starts = np.asarray(start, dtype=float) + \
+            np.concatenate((np.zeros((1, self.coef.shape[1])), np.cumsum(self.coef.sum(axis=2), axis=0)))
+
+    @property
+    def duration(self):
+        return self.bounds[-1]
+
+    def segment_at(self, t):
+        """
+        Indices of segments at times t.
+        :param t: Array of times from start of trajectory (s).
+        :return: Array of segment indices.
+        """
+        return np.clip(np.searchsorted(self.bounds, t, side='right') - 1, 0, len(self.durations) - 1)
+
+    def evaluate(self, t):
+        """
+        Evaluate trajectory.
+        :param t: Array of times from start of trajectory (s), times out of trajectory
+                  give its start or end position.
+        :return: (len(t), n_axes) positions (IRC).
+        """
+        t = np.clip(t, 0.0, self.duration)
+        i = self.segment_at(t)
+        d = self.durations[i]
+        s = np.divide(t - self.bounds[i], d, out=np.ones_like(d), where=d > 0)
+        powers = np.power.outer(s, np.arange(1, self.order + 1))
+        return self.starts[i] + np.einsum('nap,np->na', self.coef[i], powers)
+
+
+def _motion_start(times, pos, threshold, window=5):
+    """
+    Time of sample preceding the first deviation from rest position by more than threshold
+    sustained for window samples. Rest position is median of the first window samples,
+    as the robot settles off the commanded start position, single noisy samples are ignored.
+    """
+    rest = np.median(pos[:window], axis=0)
+    moved = np.any(np.abs(pos - rest) > threshold, axis=1)
+    sustained = np.convolve(moved, np.ones(window, dtype=int), 'valid') == window
+    if not np.any(sustained):
+        return times[0]
+    i = np.argmax(sustained)
+    return times[i - 1] if i > 0 else times[0]
+
+
+def estimate_lag(times, pos, path, t0, max_lag=0.5):
+    """
+    Estimate time lag of executed trajectory behind planned one by cross-correlation
+    of joint velocities.
+    :param times: Sample times (s).
+    :param pos: (N, n_axes) executed positions (IRC).
+    :param path: Planned SplinePath.
+    :param t0: Start time of trajectory (s).
+    :param max_lag: Max lag searched (s).
+    :return: Lag (s), positive when execution is late.
+    """
+    dt = np.median(np.diff(times))
+    grid = np.arange(times[0], times[-1], dt)
+    executed = np.column_stack([np.interp(grid, times, p) for p in pos.T])
+    planned = path.evaluate(grid - t0)
+    ve = np.diff(executed, axis=0)
+    vp = np.diff(planned, axis=0)
+    n = len(ve)
+    size = 1 << int(np.ceil(np.log2(2 * n)))
+    corr = np.fft.irfft(np.sum(np.fft.rfft(ve, size, axis=0) * np.conj(np.fft.rfft(vp, size, axis=0)), axis=1), size)
+    k = min(int(max_lag / dt), n - 1)
+    lags = np.concatenate((np.arange(0, k + 1), np.arange(-k, 0)))
+    corr = np.concatenate((corr[:k + 1], corr[size - k:]))
+    return lags[np.argmax(corr)] * dt
+
+
+def match_progress(times, pos, path, t0, step=0.01):
+    """
+    Match executed trajectory to planned one by distance traveled along the path, which
+    does not depend on lag or on segments prolonged by throttling. Both trajectories are
+    resampled with the same step, so that sensor noise does not accumulate in distance.
+    :param times: Sample times (s).
+    :param pos: (N, n_axes) executed positions (IRC).
+    :param path: Planned SplinePath.
+    :param t0: Start time of trajectory (s).
+    :param step: Resampling step (s).
+    :return: Tuple of times (s), executed positions (IRC) and corresponding planned times (s).
+    """
+    tau = np.arange(0.0, path.duration + step, step)
+    planned = path.evaluate(tau)
+    s_plan = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(planned, axis=0), axis=1))))
+    grid = np.arange(t0, times[-1], step)
+    executed = np.column_stack([np.interp(grid, times, p) for p in pos.T])
+    s_exec = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(executed, axis=0), axis=1))))
+    # path with repeated distances is not invertible
+    keep = np.concatenate(([True], np.diff(s_plan) > 0))
+    progress = np.maximum.accumulate(np.interp(s_exec, s_plan[keep], tau[keep]))
+    return grid, executed, progress
+
+
+def segment_stretch(grid, progress, path):
+    """
+    Ratio of executed to planned duration of segments.
+    :param grid: Times (s) returned by match_progress.
+    :param progress: Planned times (s) returned by match_progress.
+    :param path: Planned SplinePath.
+    :return: Array of stretch ratios, NaN for segments not finished within trace and instant segments.
+    """
+    keep = np.concatenate(([True], np.diff(progress) > 0))
+    t_bounds = np.interp(path.bounds, progress[keep], grid[keep], right=np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(path.durations > 0, np.diff(t_bounds) / path.durations, np.nan)
+
+
+def analyze(trace, params, order, min_times, start, t0=None, threshold=2.0, stretch_tol=0.1, max_lag=0.5, step=0.01,
+            speed=None):
+    """
+    Analyze tracking of planned spline trajectory.
+    :param trace: (N, 1 + n_axes) samples, columns are time (s) and positions (IRC), see PositionSampler.
+    :param params: Parameters of spline segments, one row per segment.
+    :param order: Order of spline.
+    :param min_times: Minimal time of segments (ms), scalar or one per segment, 0 for untimed segments.
+    :param start: Start position of trajectory (IRC).
+    :param t0: Time the trajectory started, detected from first motion if None.
+    :param threshold: Position change from rest detecting start of motion (IRC).
+    :param stretch_tol: Relative prolongation of segment reported as stretched.
+    :param max_lag: Max lag searched (s).
+    :param step: Resolution of matching executed and planned trajectory (s), see match_progress.
+    :param speed: Axis speed limits (IRC/ms), see SplinePath, required for untimed segments.
+    :return: Dictionary with lag (s), per-joint error samples, RMS and max tracking error (IRC)
+             of executed trajectory compared to lag-compensated plan, RMS error (IRC) compared
+             to plan matched by progress along the path, segment stretch ratios and indices
+             of stretched segments.
+    """
+    path = SplinePath(params, order, min_times, start, speed)
+    n_axes = path.coef.shape[1]
+    times = trace[:, 0]
+    pos = trace[:, 1:1 + n_axes]
+    if t0 is None:
+        t0 = _motion_start(times, pos, threshold)
+    lag = estimate_lag(times, pos, path, t0, max_lag)
+    error = pos - path.evaluate(times - t0 - lag)
+    grid, executed, progress = match_progress(times, pos, path, t0, step)
+    stretch = segment_stretch(grid, progress, path)
+    return {
+        't0': t0,
+        'lag': lag,
+        'time': times - t0,
+        'error': error,
+        'rms': np.sqrt(np.mean(error ** 2, axis=0)),
+        'max': np.max(np.abs(error), axis=0),
+        'path_rms': np.sqrt(np.mean((executed - path.evaluate(progress)) ** 2, axis=0)),
+        'stretch': stretch,
+        'stretched': np.flatnonzero(stretch > 1.0 + stretch_tol),
+    }
+
+
+def report(result, axes=None):
+    """
+    Print result of analyze.
+    :param result: Dictionary returned by analyze.
+    :param axes: Names of axes.
+    """
+    if axes is None:
+        axes = 'ABCDEFGH'
+    print('lag %.1f ms' % (result['lag'] * 1000))
+    for a, rms, mx, prms in zip(axes, result['rms'], result['max'], result['path_rms']):
+        print('  axis %s: tracking error rms %.1f IRC, max %.1f IRC, path error rms %.1f IRC' % (a, rms, mx, prms))
+    stretched = result['stretched']
+    if len(stretched):
+        print('%d stretched segments, max stretch %.2f at segment %d'
+              % (len(stretched), np.nanmax(result['stretch']), np.nanargmax(result['stretch'])))
+    else:
+        print('no stretched segments')
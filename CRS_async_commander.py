@@ -0,0 +1,306 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' Module provides commander variant with background serial reader and response demultiplexer. '''
+
+import collections
+import threading
+import time
+from concurrent import futures
+from concurrent.futures import Future
+
+from CRS_commander import Commander
+from CRS_response import ResponseBuffer
+
+
+class _Pending(object):
+    """
+    Response awaited by a caller. Lines read from the control unit are offered
+    to pending objects in the order the requests were sent.
+    """
+    __slots__ = ('line', 'prefix', 'accept_fail', 'future')
+
+    def __init__(self, line=None, prefix=None, accept_fail=True):
+        self.line = line
+        self.prefix = prefix
+        self.accept_fail = accept_fail
+        self.future = Future()
+
+    def offer(self, line):
+        """
+        Offer response line to the pending request.
+        :param line: Response line without line terminator.
+        :return: Boolean, whether the line was consumed.
+        """
+        if self.prefix is not None:
+            if line.startswith(self.prefix):
+                self.future.set_result(line[len(self.prefix):].strip())
+                return True
+        elif line == self.line:
+            self.future.set_result(True)
+            return True
+        if line == 'FAIL!' and self.accept_fail:
+            if self.prefix is not None:
+                self.future.set_exception(Exception('Query \'%s?\' returned \'FAIL!\'' % self.prefix[:-1]))
+            else:
+                self.future.set_result(False)
+            return True
+        return False
+
+
+class AsyncCommander(Commander):
+    """
+    Commander with a single reader thread which parses the MARS8 response stream
+    and routes 'X=...', 'R!', 'FAIL!' and 'STAMP=' lines to awaiting futures.
+    Queries can be issued from several threads and do not discard responses
+    belonging to other requests. Futures can be awaited from asyncio code
+    through asyncio.wrap_future().
+    """
+
+    def __init__(self, robot, rcon=None):
+        """
+        AsyncCommander constructor.
+        :param robot: Robot instance, e.g. robotBosch, robCRS97 or robCRS93.
+        :param rcon: Serial interface.
+        """
+        Commander.__init__(self, robot, rcon)
+        self.pending = collections.deque()
+        self.unsolicited = collections.deque(maxlen=64)
+        self.pending_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.reader = None
+        self.reader_stop = threading.Event()
+        if rcon is not None:
+            self.start_reader()
+
+    def set_rcon(self, rcon):
+        """
+        Set communication interface and restart reader thread.
+        :param rcon: Serial interface.
+        """
+        self.stop_reader()
+        Commander.set_rcon(self, rcon)
+        if rcon is not None:
+            self.start_reader()
+
+    def start_reader(self):
+        """
+        Start background thread reading responses from control unit.
+        """
+        if self.reader is not None:
+            return
+        self.reader_stop.clear()
+        self.reader = threading.Thread(target=self._reader_loop, name='mars8-reader')
+        self.reader.daemon = True
+        self.reader.start()
+
+    def stop_reader(self):
+        """
+        Stop background reader thread. Pending requests are cancelled.
+        """
+        if self.reader is None:
+            return
+        self.reader_stop.set()
+        self.reader.join()
+        self.reader = None
+        self._fail_pending(Exception('Reader stopped.'))
+
+    def close(self):
+        """
+        Stop reader thread and close communication interface.
+        """
+        self.set_rcon(None)
+
+    def _fail_pending(self, exc):
+        with self.pending_lock:
+            pending = list(self.pending)
+            self.pending.clear()
+        for p in pending:
+            if not p.future.done():
+                p.future.set_exception(exc)
+
+    def cancel(self, future):
+        """
+        Stop waiting for response, e.g. after timeout, so that the request does not
+        consume a later response belonging to another one.
+        :param future: Future returned by a request.
+        """
+        with self.pending_lock:
+            for p in self.pending:
+                if p.future is future:
+                    self.pending.remove(p)
+                    break
+        future.cancel()
+
+    def _dispatch(self, line):
+        """
+        Route one response line to the oldest request which accepts it. 'FAIL!' does
+        not identify the failed command, it is routed to the oldest waiting ready or
+        STAMP request and to the oldest query only when no such request waits, as
+        rejected commands are much more common than failing queries.
+        :param line: Response line without line terminator.
+        """
+        with self.pending_lock:
+            pending = self.pending
+            if line == 'FAIL!':
+                self.regs.clear()
+                self.last_trgt_irc = None
+                pending = sorted(pending, key=lambda p: p.prefix is not None)
+            for p in pending:
+                if p.offer(line):
+                    self.pending.remove(p)
+                    return
+        self.unsolicited.append(line)
+
+    def _reader_loop(self):
+        framing = ResponseBuffer(indexed=False)
+        while not self.reader_stop.is_set():
+            try:
+                resp = self.rcon.read(1024)
+            except Exception as e:
+                self._fail_pending(e)
+                break
+            for line in framing.feed(resp):
+                self._dispatch(line)
+
+    def _request(self, cmd, pending, key=None):
+        """
+        Register awaited response and send command atomically.
+        :param cmd: Command to send.
+        :param pending: Awaited response.
+        :param key: Request type accounted in latency statistics.
+        :return: Future of the response.
+        """
+        stats = self.stats
+        if stats is not None and key is not None:
+            t0 = time.monotonic()
+            pending.future.add_done_callback(lambda f: stats.add_latency(key, time.monotonic() - t0))
+        with self.write_lock:
+            with self.pending_lock:
+                self.pending.append(pending)
+            Commander.send_cmd(self, cmd)
+            self.flush()
+        return pending.future
+
+    def send_cmd(self, cmd):
+        """
+        Send command to command unit through serial interface.
+        :param cmd: Command to send.
+        """
+        with self.write_lock:
+            Commander.send_cmd(self, cmd)
+
+    def query_async(self, query):
+        """
+        Send query to control unit without waiting for the response. As 'FAIL!' does not
+        identify the failed command, a command rejected while no ready request waits
+        fails the oldest pending query, see _dispatch.
+        :param query: Query to send.
+        :return: Future resolved with control unit's response.
+        """
+        return self._request('\n' + query + '?\n', _Pending(prefix=query + '='), query + '?')
+
+    def query(self, query):
+        """
+        Send query to control unit.
+        :param query: Query to send.
+        :return: Control unit's response.
+        """
+        return self.query_async(query).result()
+
+    def sync_cmd_fifo_async(self):
+        """
+        Synchronize message queue without waiting for the response.
+        :return: Future resolved when the control unit processed all previous commands.
+        """
+        with self.write_lock:
+            self.stamp = (self.stamp + 1) & 0x7fff
+            stamp = self.stamp
+        return self._request('STAMP:%d\n' % stamp, _Pending(line='STAMP=%d' % stamp, accept_fail=False), 'STAMP')
+
+    def sync_cmd_fifo(self):
+        """
+        Synchronize message queue.
+        """
+        self.sync_cmd_fifo_async().result()
+
+    def sync_status(self):
+        """
+        Query status word together with STAMP synchronization, so both share one round trip.
+        :return: Status word, exception is raised on error, arm power off or motion stop.
+        """
+        st = self.query_async('ST')
+        self.sync_cmd_fifo()
+        return self.check_status(int(st.result()))
+
+    def wait_ready_async(self, axis=''):
+        """
+        Request ready state of control unit without waiting for the response.
+        :param axis: Axis to wait for, all coordinated axes if empty.
+        :return: Future resolved with True when ready or False on 'FAIL!'.
+        """
+        return self._request('\nR%s:\n' % axis, _Pending(line='R%s!' % axis))
+
+    def wait_ready(self, sync=False):
+        """
+        Wait for control unit to be ready.
+        :param sync: Boolean, whether to synchronize with control unit.
+        """
+        t0 = time.monotonic()
+        if sync:
+            self.sync_cmd_fifo()
+            print('Synchronized!')
+        ready = self.wait_ready_async().result()
+        if ready:
+            self.coordmv_queue.reset()
+        if self.stats is not None:
+            self.stats.add_blocked('wait_ready', time.monotonic() - t0)
+        return ready
+
+    def init_communication(self):
+        """
+        Initialize communication through serial interface.
+        """
+        self.send_cmd("\nECHO:0\n")
+        self.sync_cmd_fifo()
+        s = self.query('VER')
+        self.version = s
+        print('Firmware version : ' + s)
+
+    def _axis_ready(self, axis, timeout):
+        """
+        Wait for ready state of single axis.
+        :param axis: Axis to wait for.
+        :param timeout: Max time to wait (s).
+        :return: True when ready, False on 'FAIL!', None on timeout.
+        """
+        ready = self.wait_ready_async(axis)
+        try:
+            return ready.result(timeout=timeout)
+        except futures.TimeoutError:
+            self.cancel(ready)
+            return None
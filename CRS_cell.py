@@ -0,0 +1,165 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' Module provides orchestration of several robots connected through separate serial ports. '''
+
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from CRS_commander import Commander
+
+
+class Cell(object):
+    """
+    Robot cell owning several Commander instances. Each commander is driven by its own
+    I/O worker thread, so blocking calls of one robot do not delay the others and cell
+    cycle time is given by the slowest robot.
+
+    Example:
+        cell = Cell()
+        cell.open('crs97', robCRS97(), '/dev/ttyUSB0')
+        cell.open('bosch', robotBosch(), '/dev/ttyUSB1')
+        cell.init_all()
+        cell.run_synchronized({'crs97': job97, 'bosch': job_bosch}, prepare=...)
+    """
+
+    def __init__(self):
+        self.commanders = collections.OrderedDict()
+        self.workers = {}
+
+    def add(self, name, commander):
+        """
+        Add robot to the cell.
+        :param name: Name of the robot in the cell.
+        :param commander: Commander instance.
+        """
+        if name in self.commanders:
+            raise ValueError('Robot %s is already in the cell.' % name)
+        commander.name = name
+        self.commanders[name] = commander
+        self.workers[name] = ThreadPoolExecutor(max_workers=1)
+
+    def open(self, name, robot, tty_dev, speed=19200):
+        """
+        Create commander for robot and open its serial port in the robot's worker.
+        :param name: Name of the robot in the cell.
+        :param robot: Robot instance, e.g. robotBosch, robCRS97 or robCRS93.
+        :param tty_dev: Device to open.
+        :param speed: Baud rate of serial communication.
+        :return: Future of the opening.
+        """
+        self.add(name, Commander(robot))
+        return self.submit(name, lambda c: c.open_comm(tty_dev, speed=speed))
+
+    def submit(self, name, fn, *args, **kwargs):
+        """
+        Run function in the worker of robot.
+        :param name: Name of the robot in the cell.
+        :param fn: Function called as fn(commander, *args, **kwargs).
+        :return: Future of the function result.
+        """
+        return self.workers[name].submit(fn, self.commanders[name], *args, **kwargs)
+
+    def each(self, fn, *args, **kwargs):
+        """
+        Run function in workers of all robots concurrently.
+        :param fn: Function called as fn(commander, *args, **kwargs).
+        :return: Dictionary of futures by robot name.
+        """
+        return collections.OrderedDict((name, self.submit(name, fn, *args, **kwargs)) for name in self.commanders)
+
+    @staticmethod
+    def wait(futures, timeout=None):
+        """
+        Wait for all futures.
+        :param futures: Dictionary of futures by robot name.
+        :param timeout: Max time to wait for each robot (s), None to wait forever.
+        :return: Dictionary of results by robot name, the first failure is raised after all robots finished.
+        """
+        results = collections.OrderedDict()
+        error = None
+        for name, f in futures.items():
+            try:
+                results[name] = f.result(timeout)
+            except Exception as e:
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+        return results
+
+    def init_all(self, **kwargs):
+        """
+        Initialize and home all robots in parallel. Arm power prompts are asked one
+        robot at a time.
+        :param kwargs: Parameters for Commander.init.
+        """
+        return self.wait(self.each(lambda c: c.init(**kwargs)))
+
+    def wait_ready_all(self, sync=True):
+        """
+        Wait until motion of all robots is finished.
+        :param sync: Boolean, whether to synchronize with control units.
+        :return: Dictionary of wait_ready results by robot name.
+        """
+        return self.wait(self.each(lambda c: c.wait_ready(sync=sync)))
+
+    def run_synchronized(self, jobs, prepare=None, timeout=None):
+        """
+        Run jobs of several robots with synchronized start. Each robot runs its preparation
+        (e.g. move to start position and wait), then all robots wait at a barrier and
+        start their jobs together.
+        :param jobs: Dictionary of functions fn(commander) by robot name.
+        :param prepare: Dictionary of preparation functions fn(commander) by robot name, optional.
+        :param timeout: Max time to wait at barrier for the other robots (s), None to wait forever.
+        :return: Dictionary of job results by robot name.
+        """
+        prepare = prepare or {}
+        barrier = threading.Barrier(len(jobs), timeout=timeout)
+
+        def run(c, name):
+            try:
+                if name in prepare:
+                    prepare[name](c)
+            except BaseException:
+                barrier.abort()
+                raise
+            barrier.wait()
+            return jobs[name](c)
+
+        return self.wait(collections.OrderedDict((name, self.submit(name, run, name)) for name in jobs))
+
+    def close(self):
+        """
+        Stop workers and close serial ports of all robots.
+        """
+        for name, w in self.workers.items():
+            w.shutdown(wait=True)
+            self.commanders[name].set_rcon(None)
+        self.workers.clear()
+        self.commanders.clear()
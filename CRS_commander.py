@@ -30,12 +30,34 @@
 
 #  based on code by P. Pisa
 
+import json
 import sys
+import threading
 import time
+from concurrent.futures import Future
+from contextlib import contextmanager
 
 import numpy as np
 import serial
 
+from CRS_program import Program
+from CRS_queue import CoordmvQueue
+from CRS_replay import RecordingTransport
+from CRS_response import ResponseBuffer
+from CRS_stats import CommanderStats
+from CRS_stream import SplineStream
+from robotModel import kinematic_model
+from utils import select_path
+
+# File with fingerprint of last session used by resume mode
+SESSION_FILE = '.mars8_session.json'
+
+# Motion commands, sent often and never touching registers
+# serializes operator prompts of commanders initialized in parallel, e.g. by Cell.init_all
+_prompt_lock = threading.Lock()
+
+_MOTION_CMDS = frozenset(['COORDMV', 'COORDMVT', 'COORDRELMVT', 'COORDSPLINET'])
+
 
 class Commander:
 
@@ -50,7 +72,21 @@ class Commander:
         self.stamp = int(time.time() % 0x7fff)
         self.last_trgt_irc = None
         self.coordmv_commands_to_next_check = 0
+        self.coordmv_queue = CoordmvQueue(getattr(robot, 'coordmv_queue_size', 20))
         self.coord_axes = None
+        self.resp = ResponseBuffer()
+        self.wbuf = bytearray()
+        self.batch_depth = 0
+        self.batch_limit = 1024
+        self.regs = {}
+        # rewrite absolute movements to relative ones when shorter, opt-in as a lost
+        # or rejected relative movement shifts all following ones
+        self.shortest_encoding = False
+        self.stats = None
+        self.io_lock = threading.RLock()
+        self.version = None
+        # name shown in operator prompts, set by Cell to the name of robot in the cell
+        self.name = getattr(robot, 'description', None)
 
     def set_rcon(self, rcon):
         """
@@ -61,6 +97,9 @@ class Commander:
             self.rcon.close()
             self.rcon = None
         self.rcon = rcon
+        self.resp.clear()
+        del self.wbuf[:]
+        self.regs.clear()
 
     def send_cmd(self, cmd):
         """
@@ -68,13 +107,91 @@ class Commander:
         :param cmd: Command to send.
         """
         ba = bytearray(cmd, 'ascii')
-        self.rcon.write(ba)
+        with self.io_lock:
+            for line in cmd.split('\n'):
+                name, sep, args = line.partition(':')
+                if sep:
+                    self.track_cmd(name.strip(), args)
+            if self.stats is not None:
+                self.stats.command(cmd)
+            if self.batch_depth:
+                self.wbuf += ba
+                if len(self.wbuf) >= self.batch_limit:
+                    self.flush()
+            else:
+                self.write(ba)
+
+    def track_cmd(self, name, args):
+        """
+        Update state mirrored by the commander after command was sent.
+        :param name: Command name, text before ':'.
+        :param args: Command arguments, text after ':'.
+        """
+        if self.regs and name not in _MOTION_CMDS:
+            if name in ('PURGE', 'RELEASE'):
+                self.regs.clear()
+            elif name == 'COORDGRP':
+                # discontinuity belongs to coordinated group
+                self.regs.pop(('COORDISCONT', ''), None)
+            else:
+                # release of an axis or a raw register write, e.g. send_cmd('REGMSA:1000\n')
+                axis = name[7:] if name[:7] == 'RELEASE' else None
+                for key in [k for k in self.regs if k[1] == axis or k[0] + k[1] == name]:
+                    del self.regs[key]
+        coord_axes = self.coord_axes or ''
+        if name in ('PURGE', 'STOP', 'RELEASE') or \
+                (len(name) == 8 and name[:7] == 'RELEASE' and name[7] in coord_axes):
+            # movement may be cut short, its target is not known to be reached
+            self.last_trgt_irc = None
+
+    def write(self, data):
+        """
+        Write raw bytes to serial interface.
+        :param data: Bytes to write.
+        """
+        self.rcon.write(data)
+        if self.stats is not None:
+            self.stats.written(len(data))
+
+    def flush(self):
+        """
+        Send commands collected in batching mode in a single write.
+        """
+        with self.io_lock:
+            if self.wbuf:
+                self.write(bytes(self.wbuf))
+                del self.wbuf[:]
+
+    def enable_stats(self):
+        """
+        Enable collection of per-command statistics, see CommanderStats.
+        :return: CommanderStats instance.
+        """
+        self.stats = CommanderStats(getattr(self.rcon, 'baudrate', None) or 19200)
+        return self.stats
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager collecting commands sent inside the block and sending them
+        in a single write at its end. Batches can be nested, pending commands are also
+        flushed before any response is read.
+        """
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if not self.batch_depth:
+                self.flush()
 
     def read_resp(self, maxbytes):
         """
         Read response from command unit.
         :param maxbytes: Max number of bytes to read.
         """
+        if self.wbuf:
+            self.flush()
         resp = self.rcon.read(maxbytes)
         if resp is None:
             return None
@@ -83,21 +200,56 @@ class Commander:
         s = s.replace("\r", "\n")
         return s
 
+    def poll_resp(self, maxbytes=1024):
+        """
+        Read response from command unit into response buffer.
+        :param maxbytes: Max number of bytes to read.
+        :return: List of new complete response lines.
+        """
+        with self.io_lock:
+            if self.wbuf:
+                self.flush()
+            lines = self.resp.feed(self.rcon.read(maxbytes))
+        if 'FAIL!' in lines:
+            self.regs.clear()
+            self.last_trgt_irc = None
+        return lines
+
+    def set_reg(self, reg, axis, val):
+        """
+        Write register of control unit. The write is skipped when shadow copy of
+        registers shows the control unit already holds the value. Shadow copy is
+        invalidated by PURGE, RELEASE, 'FAIL!' response and reconnection, COORDGRP
+        invalidates COORDISCONT, RELEASE<axis> registers of the axis and register
+        written by raw send_cmd its own entry, see track_cmd.
+        :param reg: Register name, e.g. 'REGMS'.
+        :param axis: Axis of register, empty string for global register.
+        :param val: Integer value of register.
+        :return: Boolean, whether the register was written.
+        """
+        key = (reg, axis)
+        val = int(val)
+        if self.regs.get(key) == val:
+            if self.stats is not None:
+                self.stats.saved(reg, len(reg) + len(axis) + len(str(val)) + 2)
+            return False
+        self.send_cmd('%s%s:%i\n' % (reg, axis, val))
+        self.regs[key] = val
+        return True
+
     def irctoangles(self, a):
         """
         Convert IRC to degrees.
         :param a: IRC of angle.
         :return: Degrees corresponding to IRC.
         """
-        j = np.atleast_2d(a).shape[1]
-        n = np.atleast_2d(a).shape[0]
-        if j != self.robot.DOF:
-            raise ValueError("Wrong number of joints (%d, should be %d)." % (j, self.robot.DOF))
+        m = kinematic_model(self.robot)
+        a = np.atleast_2d(a)
+        if a.shape[1] != m.DOF:
+            raise ValueError("Wrong number of joints (%d, should be %d)." % (a.shape[1], m.DOF))
 
-        b = np.divide((a - np.repeat(np.array([self.robot.hhirc]), n, axis=0)),
-                        np.repeat(np.array([self.robot.degtoirc]), n, axis=0)) \
-            + np.repeat(np.array([self.robot.hhdeg]), n, axis=0)
-        if n == 1:
+        b = (a - m.hhirc) * m.irctodeg + m.hhdeg
+        if len(b) == 1:
             return b[0]
         else:
             return b
@@ -108,18 +260,16 @@ class Commander:
         :param a: Degrees of angle.
         :return: IRC corresponding to degrees.
         """
-        j = np.atleast_2d(a).shape[1]
-        n = np.atleast_2d(a).shape[0]
-        if j != self.robot.DOF:
-            raise ValueError("Wrong number of joints (%d, should be %d)." % (j, self.robot.DOF))
+        m = kinematic_model(self.robot)
+        a = np.atleast_2d(a)
+        if a.shape[1] != m.DOF:
+            raise ValueError("Wrong number of joints (%d, should be %d)." % (a.shape[1], m.DOF))
 
-        b = np.multiply((a - np.repeat(np.array([self.robot.hhdeg]), n, axis=0)),
-                        np.repeat(np.array([self.robot.degtoirc]), n, axis=0)) \
-            + np.repeat(np.array([self.robot.hhirc]), n, axis=0)
-        if n == 1:
-            return np.rint(b[0])
+        b = np.rint((a - m.hhdeg) * m.degtoirc + m.hhirc)
+        if len(b) == 1:
+            return b[0]
         else:
-            return np.rint(b)
+            return b
 
     def degtorad(self, d):
         """
@@ -137,20 +287,19 @@ class Commander:
         """
         return d * 180.0 / np.pi
 
-    def init_robot(self):
+    def init_robot(self, fast=False, arm_power=True):
         """
         Initialize robot. Function performs all necessary settings of control unit.
         Initialization may require user to press ARM POWER button (placed on control unit).
+        :param fast: Boolean, whether to upload whole parameter block in a single write
+                     verified by a single round trip, see init_robot_fast.
+        :param arm_power: Boolean, whether to switch on arm power.
         """
+        if fast:
+            return self.init_robot_fast(arm_power)
         self.sync_cmd_fifo()
-        if hasattr(self.robot, 'REGPWRON') and self.robot.REGPWRON == 1:
-            self.send_cmd('REGPWRON:%i\n'%self.robot.REGPWRON)
-            print('Press ARM POWER button,\n')
-            if sys.version_info[0] < 3:
-                raw_input('press enter to continue...')
-            else:
-                input('press enter to continue...')
-            self.send_cmd('REGPWRFLG:%i\n'%self.robot.REGPWRFLG)
+        if arm_power:
+            self.power_on()
 
         print('Resetting motors')
         # Purge
@@ -160,6 +309,57 @@ class Commander:
         self.check_ready()
         self.wait_ready()
 
+        with self.batch():
+            self.upload_params()
+
+    def init_robot_fast(self, arm_power=True):
+        """
+        Initialize robot with a single write of the whole parameter block followed by
+        status query and STAMP synchronization, which verifies the upload in one round trip.
+        :param arm_power: Boolean, whether to switch on arm power.
+        :return: Startup time (s), arm power-on confirmation is not included.
+        """
+        if arm_power:
+            self.power_on()
+
+        print('Resetting motors')
+        t0 = time.monotonic()
+        batch_limit = self.batch_limit
+        self.batch_limit = sys.maxsize
+        try:
+            with self.batch():
+                self.send_cmd("PURGE:\n")
+                self.send_cmd("STOP:\n")
+                self.upload_params()
+                self.sync_status()
+        finally:
+            self.batch_limit = batch_limit
+        self.coordmv_queue.reset()
+        t = time.monotonic() - t0
+        if self.stats is not None:
+            self.stats.add_phase('init_robot', t)
+        print('Robot initialized in %.3f s' % t)
+        return t
+
+    def power_on(self):
+        """
+        Switch on arm power if robot requires it, asks user to press ARM POWER button.
+        Prompts of several commanders are serialized, each names its robot.
+        """
+        if hasattr(self.robot, 'REGPWRON') and self.robot.REGPWRON == 1:
+            with _prompt_lock:
+                self.send_cmd('REGPWRON:%i\n'%self.robot.REGPWRON)
+                print('Press ARM POWER button of %s,\n' % self.name)
+                if sys.version_info[0] < 3:
+                    raw_input('press enter to continue...')
+                else:
+                    input('press enter to continue...')
+                self.send_cmd('REGPWRFLG:%i\n'%self.robot.REGPWRFLG)
+
+    def upload_params(self):
+        """
+        Send speed, acceleration, regulator and gripper parameters of robot to control unit.
+        """
         self.set_speed_par(self.robot.defaultspeed)
         self.set_acc_par(self.robot.defaultacceleration)
 
@@ -170,10 +370,10 @@ class Commander:
             if param_list:
                 for i in range(self.robot.DOF):
                     if self.robot.activemotors[i]:
-                        self.send_cmd('%s%s:%i\n' % (f, self.robot.activemotors[i], param_list[i]))
+                        self.set_reg(f, self.robot.activemotors[i], param_list[i])
 
         if hasattr(self.robot, 'IDLEREL'):
-            self.send_cmd('IDLEREL:%i\n'%self.robot.IDLEREL)
+            self.set_reg('IDLEREL', '', self.robot.IDLEREL)
 
         if hasattr(self.robot, 'gripper_init'):
             if self.robot.verbose:
@@ -187,30 +387,47 @@ class Commander:
         """
         Synchronize message queue.
         """
+        t0 = time.monotonic()
         self.stamp = (self.stamp + 1) & 0x7fff
         self.send_cmd('STAMP:%d\n' % self.stamp)
-        buf='\n'
+        s = '%d' % self.stamp
         while True:
-            buf += self.read_resp(1024)
-            i = buf.find('\n' + 'STAMP=')
-            if i < 0:
-                continue
-            s = '%d'%self.stamp
-            r = buf[i+7:]
-            j = r.find('\n')
-            if j < 0:
-                continue
-            r = r[0:j].strip()
-            if r == s:
+            r = self.resp.take('STAMP')
+            if r is None:
+                self.poll_resp()
+            elif r.strip() == s:
                 break
+        if self.stats is not None:
+            self.stats.add_latency('STAMP', time.monotonic() - t0)
 
-    def check_ready(self, for_coordmv_queue = False):
+    def query_status(self):
         """
-        Check robot is in "ready" state.
-        :param for_coordmv_queue: Boolean, whether to check state for coordinate movement message queue.
-        :return: Boolean, whether robot is ready or not.
+        Query status word of control unit.
+        :return: Status word, exception is raised on error, arm power off or motion stop.
+        """
+        return self.check_status(int(self.query('ST')))
+
+    def sync_status(self):
+        """
+        Query status word together with STAMP synchronization, so both share one round trip.
+        :return: Status word, exception is raised on error, arm power off or motion stop.
+        """
+        self.resp.discard('ST')
+        self.send_cmd('\nST?\n')
+        self.sync_cmd_fifo()
+        resp = self.resp.take('ST')
+        try:
+            a = int(resp)
+        except (TypeError, ValueError):
+            raise Exception('Query \'ST?\' returned invalid response \'%s\'' % resp)
+        return self.check_status(a)
+
+    def check_status(self, a):
+        """
+        Check status word of control unit.
+        :param a: Status word.
+        :return: Status word, exception is raised on error, arm power off or motion stop.
         """
-        a = int(self.query('ST'))
         s = ''
         if a & 0x8:
             s = 'error, '
@@ -220,6 +437,17 @@ class Commander:
             s += 'motion stop, '
         if s:
             raise Exception('Check ready: %s.'%s[:-2])
+        if not a & 0x10:
+            self.coordmv_queue.reset()
+        return a
+
+    def check_ready(self, for_coordmv_queue = False):
+        """
+        Check robot is in "ready" state.
+        :param for_coordmv_queue: Boolean, whether to check state for coordinate movement message queue.
+        :return: Boolean, whether robot is ready or not.
+        """
+        a = self.query_status()
         if for_coordmv_queue:
             return False if a & 0x80 else True
         else:
@@ -231,19 +459,20 @@ class Commander:
         :param params: Minimal and maximal speed for motors.
         :param force: Force set, ignores lower and upper bound of speed set in robot object.
         """
-        for i in range(self.robot.DOF):
-            if self.robot.activemotors[i] != '':
-                if np.imag(params[i]) or params[i] == 0: # relative speed
-                    r = np.imag(params[i])
-                    if r < 0 or r > 1:
-                        raise  Exception('Relative speed %i out of <0;1>'%i)
-                    params[i] = round(self.robot.minspeed[i] * (1 - r) + self.robot.maxspeed[i] * r)
-                    self.send_cmd('%s%s:%i\n'%('REGMS', self.robot.activemotors[i], params[i]))
-                elif not force and (params[i] < self.robot.minspeed[i] or params[i] > self.robot.maxspeed[i]):
-                    # speed is not inside lower and upper bound
-                    raise Exception('Speed %d is out of bound'%i)
-                else: # set the speed
-                    self.send_cmd('%s%s:%i\n'%('REGMS', self.robot.activemotors[i], params[i]))
+        with self.batch():
+            for i in range(self.robot.DOF):
+                if self.robot.activemotors[i] != '':
+                    if np.imag(params[i]) or params[i] == 0: # relative speed
+                        r = np.imag(params[i])
+                        if r < 0 or r > 1:
+                            raise  Exception('Relative speed %i out of <0;1>'%i)
+                        params[i] = round(self.robot.minspeed[i] * (1 - r) + self.robot.maxspeed[i] * r)
+                        self.set_reg('REGMS', self.robot.activemotors[i], params[i])
+                    elif not force and (params[i] < self.robot.minspeed[i] or params[i] > self.robot.maxspeed[i]):
+                        # speed is not inside lower and upper bound
+                        raise Exception('Speed %d is out of bound'%i)
+                    else: # set the speed
+                        self.set_reg('REGMS', self.robot.activemotors[i], params[i])
 
     def set_acc_par(self, params, force=False):
         """
@@ -251,19 +480,20 @@ class Commander:
         :param params: Minimal and maximal acceleration for motors.
         :param force: Force set, ignores lower and upper bound of acceleration set in robot object.
         """
-        for i in range(self.robot.DOF):
-            if self.robot.activemotors[i] != '':
-                if np.imag(params[i]) or params[i] == 0:  # relative acceleration
-                    r = np.imag(params[i])
-                    if r < 0 or r > 1:
-                        raise  Exception('Relative acceleration %i out of <0;1>'%i)
-                    params[i] = round(self.robot.minacceleration[i] * (1 - r) + self.robot.maxacceleration[i] * r)
-                    self.send_cmd('%s%s:%i\n'%('REGACC', self.robot.activemotors[i], params[i]))
-                elif not force and (params[i] < self.robot.minacceleration[i] or params[i] > self.robot.maxacceleration[i]):
-                    # acceleration is not inside lower and upper bound
-                    raise Exception('Acceleration %d is out of bound'%i)
-                else: # set the speed
-                    self.send_cmd('%s%s:%i\n'%('REGACC', self.robot.activemotors[i], params[i]))
+        with self.batch():
+            for i in range(self.robot.DOF):
+                if self.robot.activemotors[i] != '':
+                    if np.imag(params[i]) or params[i] == 0:  # relative acceleration
+                        r = np.imag(params[i])
+                        if r < 0 or r > 1:
+                            raise  Exception('Relative acceleration %i out of <0;1>'%i)
+                        params[i] = round(self.robot.minacceleration[i] * (1 - r) + self.robot.maxacceleration[i] * r)
+                        self.set_reg('REGACC', self.robot.activemotors[i], params[i])
+                    elif not force and (params[i] < self.robot.minacceleration[i] or params[i] > self.robot.maxacceleration[i]):
+                        # acceleration is not inside lower and upper bound
+                        raise Exception('Acceleration %d is out of bound'%i)
+                    else: # set the speed
+                        self.set_reg('REGACC', self.robot.activemotors[i], params[i])
 
     def init_communication(self):
         """
@@ -273,6 +503,7 @@ class Commander:
         self.send_cmd("\nECHO:0\n")
         self.sync_cmd_fifo()
         s = self.query('VER')
+        self.version = s
         print('Firmware version : ' + s)
 
     def set_int_param_for_axes(self, param, val, axes_list=None):
@@ -284,9 +515,9 @@ class Commander:
         """
         if axes_list is None:
             axes_list = self.robot.control_axes_list
-        valstr = str(int(val))
-        for a in axes_list:
-            self.send_cmd(param + a + ':' + valstr + '\n')
+        with self.batch():
+            for a in axes_list:
+                self.set_reg(param, a, val)
 
     def set_max_speed(self, val, axes_list=None):
         """
@@ -296,6 +527,14 @@ class Commander:
         """
         self.set_int_param_for_axes(axes_list=axes_list, param='REGMS', val=val)
 
+    def coord_speed(self):
+        """
+        Speed limits of coordinated axes read from control unit.
+        :return: Array of speeds (IRC/ms), REGMS is in IRC/256/ms.
+        """
+        axes = self.coord_axes or self.robot.coord_axes
+        return np.array([float(self.query('REGMS' + a)) for a in axes]) / 256.0
+
     def setup_coordmv(self, axes_list=None):
         """
         Setup coordinate movement of joints in axes_list.
@@ -309,54 +548,99 @@ class Commander:
         self.wait_ready()
         self.coord_axes = axes_list
         self.last_trgt_irc = None
+        self.coordmv_queue.reset()
 
-    def throttle_coordmv(self):
+    def throttle_coordmv(self, min_time=None):
         """
-        Throttle message queue for coordinate movement.
+        Throttle message queue for coordinate movement. Queue occupancy is predicted
+        from segment durations, sending is delayed until predicted drain point when
+        the queue is close to full. Prediction is verified by status query when
+        the queue is expected to be full and at least every 20 segments.
+        :param min_time: Minimal time of the segment to be sent (ms).
         :return: Boolean whether the queue is throttled.
         """
+        q = self.coordmv_queue
         throttled = False
+        t0 = now = time.monotonic()
+        if q.depth(now) >= q.limit():
+            self.flush()
+            time.sleep(max(0.0, q.drain_time(q.limit() - 1) - now))
+            throttled = True
+            self.coordmv_commands_to_next_check = 0
         if self.coordmv_commands_to_next_check <= 0:
             self.coordmv_commands_to_next_check = 20
+            while self.query_status() & 0x80:
+                if not throttled:
+                    print('coordmv queue full - waiting')
+                throttled = True
+                q.mark_full()
+                time.sleep(q.segment_time)
         else:
             self.coordmv_commands_to_next_check -= 1
-            return
-        while not self.check_ready(for_coordmv_queue = True):
-            if not throttled:
-                print('coordmv queue full - waiting')
-            throttled = True
+        q.push(min_time / 1000.0 if min_time else None)
+        if self.stats is not None:
+            self.stats.add_blocked('throttle_coordmv', time.monotonic() - t0)
         return throttled
 
     def coordmv(self, pos, min_time=None, relative=False, disc=5):
         """
-        Coordinate movement of joints.
+        Coordinate movement of joints. The movement is sent in the shortest of absolute
+        (COORDMV, COORDMVT) and relative (COORDRELMVT) encodings when shortest_encoding
+        is set and the previous target is known, bytes saved are accounted in statistics.
+        Previous target is forgotten on PURGE, STOP, RELEASE and 'FAIL!' response.
         :param pos: Position to move to.
         :param min_time: Minimal time for the movement, if None movement is carried in minimal possible time.
         :param relative: Boolean, whether movement is relative to previous (current) position.
         :param disc: Discontinuity of movement, internal parameter, is to be found in control unit docs.
         """
-        self.throttle_coordmv()
-        self.send_cmd('COORDISCONT:%d'%disc + '\n')
-        cmd = 'COORDMV' if not relative else 'COORDRELMVT'
-        if (min_time is not None) and not relative:
-            cmd += 'T'
-        cmd += ':'
-        if (min_time is not None) or relative:
-            if min_time is None:
-                min_time=0
-            cmd += str(int(round(min_time)))
-            if len(pos) > 0:
-                cmd += ','
+        self.throttle_coordmv(min_time)
+        t = int(round(min_time)) if min_time is not None else 0
         pos = [int(round(p)) for p in pos]
-        cmd += ','.join([str(p) for p in pos])
-        self.send_cmd(cmd + '\n')
+        last = self.last_trgt_irc
         if relative:
-            if self.last_trgt_irc is None:
+            if last is None:
                 raise ValueError("Relative movement is requested, but last_trgt_irc is None!")
-            pos = [p + t for p, t in zip(pos, self.last_trgt_irc)]
-            # pos = map(int.__add__, pos, self.last_trgt_irc)
+            delta = pos
+            pos = [p + l for p, l in zip(delta, last)]
+            cmd = self.encode_coordrelmv(t, delta)
+        else:
+            cmd = self.encode_coordmv(t, pos, min_time is not None)
+        if self.shortest_encoding:
+            n = len(cmd)
+            candidates = [cmd, self.encode_coordmv(t, pos, t != 0)]
+            if last is not None and len(last) == len(pos):
+                candidates.append(self.encode_coordrelmv(t, [p - l for p, l in zip(pos, last)]))
+            cmd = min(candidates, key=len)
+            if self.stats is not None and len(cmd) < n:
+                self.stats.saved('COORDMV', n - len(cmd))
+        with self.batch():
+            self.send_coordiscont(disc)
+            self.send_cmd(cmd)
         self.last_trgt_irc = pos
 
+    @staticmethod
+    def encode_coordmv(t, pos, timed=True):
+        """
+        Encode absolute coordinated movement.
+        :param t: Minimal time for the movement (ms).
+        :param pos: Target position (IRC).
+        :param timed: Boolean, whether to send minimal time (COORDMVT) or not (COORDMV).
+        :return: Command.
+        """
+        if timed:
+            return 'COORDMVT:%d,%s\n' % (t, ','.join([str(p) for p in pos]))
+        return 'COORDMV:%s\n' % ','.join([str(p) for p in pos])
+
+    @staticmethod
+    def encode_coordrelmv(t, delta):
+        """
+        Encode relative coordinated movement.
+        :param t: Minimal time for the movement (ms), 0 for minimal possible time.
+        :param delta: Position change (IRC).
+        :return: Command.
+        """
+        return 'COORDRELMVT:%d,%s\n' % (t, ','.join([str(p) for p in delta]))
+
     def splinemv(self, param, order=1, min_time=None, disc=5):
         """
         Spline movement.
@@ -366,8 +650,7 @@ class Commander:
         :param disc: Discontinuity of movement, internal parameter, is to be found in control unit docs.
         :return: Command for unit for specified parameters.
         """
-        self.throttle_coordmv()
-        self.send_cmd('COORDISCONT:%d' % disc + '\n')
+        self.throttle_coordmv(min_time)
         param = [int(round(p)) for p in param]
         cmd = 'COORDSPLINET'
         if min_time is None:
@@ -379,41 +662,67 @@ class Commander:
         cmd += ','
         cmd += ','.join([str(p) for p in param])
 
-        self.send_cmd(cmd + '\n')
+        with self.batch():
+            self.send_coordiscont(disc)
+            self.send_cmd(cmd + '\n')
+        # end point of the spline is known to control unit only
+        self.last_trgt_irc = None
         return cmd
 
+    def stream(self, maxsize=64, sync=True):
+        """
+        Start streaming of spline segments from feeder thread, see CRS_stream.SplineStream.
+        Segments are queued by SplineStream.put() with parameters of splinemv(), the stream
+        is finished by SplineStream.close() which returns completion future.
+        :param maxsize: Max number of segments waiting for the feeder, put() blocks when full.
+        :param sync: Boolean, whether completion waits for the end of motion.
+        :return: SplineStream instance.
+        """
+        return SplineStream(self, maxsize=maxsize, sync=sync)
+
+    def send_coordiscont(self, disc):
+        """
+        Set discontinuity of following coordinated movement. The command is skipped
+        when the value has not changed since the last one sent, see set_reg.
+        :param disc: Discontinuity of movement, internal parameter, is to be found in control unit docs.
+        """
+        self.set_reg('COORDISCONT', '', disc)
+
     def axis_get_pos(self, axis_lst=None):
         """
         Get position of joints.
-        :return: Position of active joints.
+        :return: Tuple of control unit time and position of active joints.
         """
-        if axis_lst is None:
-            axis_lst = self.robot.coord_axes
         resp = self.query('COORDAP')
         try:
-            resp = np.array(map(int,resp.split(',')))
-        except:
-            print('Error responce', resp)
+            resp = np.array([int(v) for v in resp.split(',')])
+        except ValueError:
+            raise Exception('Query \'COORDAP?\' returned invalid response \'%s\'' % resp)
         t = resp[0]
-        pos = resp[-6:]
+        pos = resp[1:1 + self.robot.DOF]
         return t, pos
 
     def hard_home(self, axes_list=None):
         """
         Robot hard homing. Returns joints in axes_list to home position.
-        :param axes_list: List of joints to home.
+        Axes are homed group by group, axes of a group home concurrently.
+        :param axes_list: List of joints to home, each joint homed separately, or list of
+                          groups such as ['B', 'AC', 'DEF']. Default is hh_plan of robot,
+                          or hh_axes_list if robot has no homing plan.
         """
         # Hard-home
         if axes_list is None:
-            axes_list = self.robot.hh_axes_list
+            axes_list = getattr(self.robot, 'hh_plan', None) or self.robot.hh_axes_list
 
         self.set_speed_par(self.robot.defaultspeed)
         self.set_acc_par(self.robot.defaultacceleration)
 
         self.last_trgt_irc = None
 
-        for a in axes_list:
-            self.send_cmd('HH' + a + ':\n')
+        for group in axes_list:
+            with self.batch():
+                for a in group:
+                    self.send_cmd('HH' + a + ':\n')
             self.wait_ready()
 
     def soft_home(self, axes_list=None):
@@ -436,19 +745,16 @@ class Commander:
         :param query: Query to send.
         :return: Control unit's response.
         """
-        buf = '\n'
+        t0 = time.monotonic()
+        self.resp.discard(query)
         self.send_cmd('\n' + query + '?\n')
         while True:
-            buf += self.read_resp(1024)
-            i = buf.find('\n' + query + '=')
-            if i < 0:
-                continue
-            j = buf[i+1:].find('\n')
-            if j != -1:
+            res = self.resp.take(query)
+            if res is not None:
                 break
-        if buf[i+1+j-1] == '\r':
-            j -= 1
-        res = buf[i+2+len(query):i+1+j]
+            self.poll_resp()
+        if self.stats is not None:
+            self.stats.add_latency(query + '?', time.monotonic() - t0)
         return res
 
     def command(self, command):
@@ -466,6 +772,7 @@ class Commander:
         :return: Coordinates of closest position in IRC or None if there isn't any position reachable
         """
         a = self.robot.ikt(self.robot, pos)
+        bound = kinematic_model(self.robot).bound
         num = None
         min_dist = float('Inf')
 
@@ -475,8 +782,8 @@ class Commander:
             prev_pos = self.anglestoirc(np.array(self.robot.hhdeg)) if prev_pos is None else prev_pos
         for i in range(len(a)):
             irc = self.anglestoirc(a[i])
-            validm = irc > self.robot.bound[0]
-            validp = irc < self.robot.bound[1]
+            validm = irc > bound[0]
+            validp = irc < bound[1]
             valid = np.logical_and(validm, validp)
             if np.all(valid):
                 dist = np.linalg.norm(np.array(irc) - prev_pos)
@@ -489,6 +796,102 @@ class Commander:
 
         return irc
 
+    def ikt_candidates(self, pos):
+        """
+        All IKT solutions of a sequence of positions in IRC.
+        :param pos: (N, n) coordinates of positions, specified in world coordinates.
+        :return: Tuple of (N, K, DOF) solutions in IRC and (N, K) mask of solutions valid and within bounds.
+        """
+        sol, mask = self.robot.ikt_batch(self.robot, pos)
+        n, k, dof = sol.shape
+        irc = self.anglestoirc(sol.reshape(n * k, dof)).reshape(n, k, dof)
+        bound = kinematic_model(self.robot).bound
+        with np.errstate(invalid='ignore'):
+            valid = mask & np.all(irc > bound[0], axis=2) & np.all(irc < bound[1], axis=2)
+        return irc, valid
+
+    def find_closest_ikt_batch(self, pos, prev_pos=None):
+        """
+        Find configurations of a sequence of positions, each closest to the previous one,
+        the first one closest to previous position or home position.
+        :param pos: (N, n) coordinates of positions, specified in world coordinates.
+        :param prev_pos: Previous position of robot in IRC.
+        :return: (N, DOF) coordinates of positions in IRC, exception is raised if any position is unreachable.
+        """
+        irc, valid = self.ikt_candidates(pos)
+        unreachable = ~np.any(valid, axis=1)
+        if np.any(unreachable):
+            raise ValueError("Position %d is unreachable!" % np.argmax(unreachable))
+
+        if prev_pos is None:
+            prev_pos = self.anglestoirc(np.array(getattr(self.robot, 'shdeg', self.robot.hhdeg)))
+        n, k, dof = irc.shape
+        res = np.empty((n, dof))
+        for i in range(n):
+            dist = np.linalg.norm(irc[i] - prev_pos, axis=1)
+            dist[~valid[i]] = np.inf
+            prev_pos = res[i] = irc[i, np.argmin(dist)]
+        return res
+
+    def find_ikt_path(self, pos, prev_pos=None, margin=0.05, margin_weight=1000.0, max_step=None):
+        """
+        Find configurations of a sequence of positions minimizing joint motion along the whole
+        path and keeping away from joint bounds, see utils.select_path. Unlike greedy
+        find_closest_ikt_batch, choice at one point takes following points into account,
+        which avoids dead ends and elbow or wrist flips later on the path.
+        :param pos: (N, n) coordinates of positions, specified in world coordinates.
+        :param prev_pos: Previous position of robot in IRC, home position if None.
+        :param margin: Distance from bound penalized, as fraction of joint range.
+        :param margin_weight: Penalty of configuration lying at joint bound (IRC).
+        :param max_step: Max change of any joint between consecutive points (IRC), None for no limit.
+        :return: (N, DOF) coordinates of positions in IRC, exception is raised with index
+                 of the first position which cannot be reached.
+        """
+        irc, valid = self.ikt_candidates(pos)
+        if prev_pos is None:
+            prev_pos = self.anglestoirc(np.array(getattr(self.robot, 'shdeg', self.robot.hhdeg)))
+        path, cost = select_path(irc, valid, prev_pos, kinematic_model(self.robot).bound, margin, margin_weight, max_step)
+        return irc[np.arange(len(path)), path]
+
+    def run_program(self, path):
+        """
+        Run motion program compiled by CRS_program.compile_program. Program is streamed
+        from memory-mapped file, blocks of precompiled segments which fit into the
+        coordinated movement queue are sent in single writes.
+        :param path: Path to program file.
+        """
+        prg = Program(path)
+        try:
+            self.wait_ready()
+            self.write(prg.coordgrp)
+            self.regs.pop(('COORDISCONT', ''), None)
+            self.wait_ready()
+            self.coord_axes = prg.axes
+            self.coordmv_queue.reset()
+            self.write(prg.start_cmd)
+            self.wait_ready(sync=True)
+            self.write(prg.disc_cmd)
+            self.regs[('COORDISCONT', '')] = prg.disc
+
+            q = self.coordmv_queue
+            n = len(prg)
+            i = 0
+            while i < n:
+                self.throttle_coordmv(prg.min_times[i])
+                k = min(n - i, max(1, q.limit() - q.depth() + 1))
+                for t in prg.min_times[i + 1:i + k]:
+                    q.push(t / 1000.0 if t else None)
+                self.coordmv_commands_to_next_check -= k - 1
+                self.write(prg.segments(i, i + k))
+                if self.stats is not None:
+                    self.stats.commands['COORDSPLINET'] += k
+                    self.stats.bytes_sent['COORDSPLINET'] += int(prg.offsets[i + k] - prg.offsets[i])
+                i += k
+            self.last_trgt_irc = [int(p) for p in prg.end]
+            self.wait_ready(sync=True)
+        finally:
+            prg.close()
+
     def move_to_pos(self, irc, relative=False):
         """
         Move robot to coordinates stated in IRC using coordinated movement.
@@ -507,56 +910,118 @@ class Commander:
         Wait for control unit to be ready.
         :param sync: Boolean, whether to synchronize with control unit.
         """
-        buf = '\n'
+        t0 = time.monotonic()
         if sync:
             self.sync_cmd_fifo()
             print('Synchronized!')
+        self.resp.discard('R!')
+        self.resp.discard('FAIL!')
         self.send_cmd("\nR:\n")
         while True:
-            buf += self.read_resp(1024)
-            if buf.find('\nR!') >= 0:
-                return True
-            if buf.find('\nFAIL!') >= 0:
-                return False
+            self.poll_resp()
+            if self.resp.take('R!') is not None:
+                self.coordmv_queue.reset()
+                ready = True
+                break
+            if self.resp.take('FAIL!') is not None:
+                ready = False
+                break
+        if self.stats is not None:
+            self.stats.add_blocked('wait_ready', time.monotonic() - t0)
+        return ready
 
     def wait_gripper_ready(self):
         """
         Wait for gripper to be ready.
+        :return: Settled gripper position, None if gripper axis did not report ready state.
+        """
+        return self.gripper_settle().result()
+
+    def gripper_settle(self, threshold=None, period=0.02, deadline=10.0, ready_timeout=2.0):
+        """
+        Detect settling of gripper in a background thread, so arm motion can continue
+        while the gripper closes. Gripper position is sampled with a steady period,
+        the serial port configuration is not changed.
+        :param threshold: Gripper speed (IRC/s) considered as settled, default gripper_poll_diff per period.
+        :param period: Sampling period of gripper position (s).
+        :param deadline: Max time to wait for gripper to settle (s).
+        :param ready_timeout: Max time to wait for ready state of gripper axis (s).
+        :return: Future resolved with settled gripper position, or None if gripper axis did not report ready state.
         """
         if not hasattr(self.robot, 'gripper_ax'):
             raise Exception('This robot has no gripper_ax defined.')
+        if threshold is None:
+            threshold = self.robot.gripper_poll_diff / period
+        future = Future()
+        t = threading.Thread(target=self._gripper_settle, name='gripper-settle',
+                             args=(future, threshold, period, deadline, ready_timeout))
+        t.daemon = True
+        t.start()
+        return future
 
-        self.send_cmd('\nR%s:\n'%self.robot.gripper_ax)
-        self.rcon.timeout = 2
-
-        s = self.read_resp(1024)
-        self.rcon.timeout = 0.01
-        if s.find('R%s!\r\n' % self.robot.gripper_ax) >= 0:
-            last = float('inf')
-            while True:
-                self.send_cmd('AP%s?\n'%self.robot.gripper_ax)
-                s = self.read_resp(1024)
-
-                if s.find('\nFAIL!') >= 0:
-                    raise Exception('Command \'AP\' returned \'FAIL!\n')
-                ifs = s.find('AP%s=' % self.robot.gripper_ax)
-                if ifs >= 0:
-                    ifl = s.find('\r\n')
-                    p = float(s[ifs+4:ifl])
-                if abs(last - p) < self.robot.gripper_poll_diff:
-                    break
-                last = p
-            time.sleep(self.robot.gripper_poll_time/100)
-
-        elif s.find('\nFAIL!') >= 0:
+    def _gripper_settle(self, future, threshold, period, deadline, ready_timeout):
+        """
+        Body of gripper settle detection thread, see gripper_settle.
+        """
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self._gripper_settle_loop(threshold, period, deadline, ready_timeout))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _gripper_settle_loop(self, threshold, period, deadline, ready_timeout):
+        ax = self.robot.gripper_ax
+        t_end = time.monotonic() + deadline
+        ready = self._axis_ready(ax, ready_timeout)
+        if ready is None:
+            return None
+        if not ready:
             self.wait_ready()
-            raise Exception('Command \'R:%s\' returned \'FAIL!\''%self.robot.gripper_ax)
+            raise Exception('Command \'R:%s\' returned \'FAIL!\'' % ax)
+        last = None
+        t_next = time.monotonic()
+        while True:
+            t = time.monotonic()
+            p = float(self.query('AP%s' % ax))
+            if last is not None and abs(p - last[1]) <= threshold * (t - last[0]):
+                return p
+            if t > t_end:
+                raise TimeoutError('Gripper did not settle within %g s.' % deadline)
+            last = (t, p)
+            t_next += period
+            dt = t_next - time.monotonic()
+            if dt > 0:
+                time.sleep(dt)
+            else:
+                t_next = time.monotonic()
+
+    def _axis_ready(self, axis, timeout):
+        """
+        Wait for ready state of single axis.
+        :param axis: Axis to wait for.
+        :param timeout: Max time to wait (s).
+        :return: True when ready, False on 'FAIL!', None on timeout.
+        """
+        key = 'R%s!' % axis
+        self.resp.discard(key)
+        self.resp.discard('FAIL!')
+        self.send_cmd('\nR%s:\n' % axis)
+        t_end = time.monotonic() + timeout
+        while time.monotonic() < t_end:
+            self.poll_resp()
+            if self.resp.take(key) is not None:
+                return True
+            if self.resp.take('FAIL!') is not None:
+                return False
+        return None
 
-    def open_comm(self, tty_dev, speed=19200):
+    def open_comm(self, tty_dev, speed=19200, record=None):
         """
         Open serial communication port.
         :param tty_dev: Device to open.
         :param speed: Baud rate of serial communication.
+        :param record: Path to log recording the serial session, None for no recording.
         """
         print("Opening %s ...\n" % tty_dev)
         ser = serial.Serial(tty_dev,
@@ -566,6 +1031,8 @@ class Commander:
                             stopbits=serial.STOPBITS_ONE,
                             rtscts=True,
                             timeout=0.01)
+        if record is not None:
+            ser = RecordingTransport(ser, record)
 
         self.set_rcon(ser)
         self.init_communication()
@@ -579,12 +1046,17 @@ class Commander:
     def init(self, **kwargs):
         """
         Initialize commander. Initialize robot and perform homing.
-        :param kwargs: Parameters for initialisation.
-        """
-        self.init_robot()
+        :param kwargs: Parameters for initialisation. With resume=True homing is skipped when
+                       control unit kept its reference since the session saved in file
+                       session (default SESSION_FILE), see check_session.
+        """
+        resume = kwargs.get('resume', False)
+        session = kwargs.get('session', SESSION_FILE)
+        homed = resume and self.check_session(session)
+        self.init_robot(fast=kwargs.get('fast', False), arm_power=not homed)
         reg_type = kwargs.get('reg_type', None)
         max_speed = kwargs.get('max_speed', None)
-        hard_home = kwargs.get('hard_home', True)
+        hard_home = kwargs.get('hard_home', True) and not homed
 
         if reg_type is not None:
             self.send_cmd("RELEASE:\n")
@@ -599,8 +1071,68 @@ class Commander:
             self.soft_home()
             print("Hard and soft home done!")
 
+        if resume:
+            self.save_session(session)
+
+    def session_state(self):
+        """
+        Get fingerprint of current session: robot description, firmware version, last STAMP
+        and positions of axes.
+        :return: Dictionary with session fingerprint.
+        """
+        axes = self.robot.control_axes_list
+        return {'description': self.robot.description,
+                'version': self.version,
+                'stamp': self.stamp,
+                'axes': axes,
+                'positions': [int(float(self.query('AP' + a))) for a in axes]}
+
+    def save_session(self, path=SESSION_FILE):
+        """
+        Save fingerprint of current session, robot should not move.
+        :param path: Path to session file.
+        """
+        self.sync_cmd_fifo()
+        state = self.session_state()
+        state['time'] = time.time()
+        with open(path, 'w') as f:
+            json.dump(state, f)
+
+    def check_session(self, path=SESSION_FILE, tolerance=50):
+        """
+        Check whether control unit kept its state since the session saved in file, i.e. it runs
+        the same firmware for the same robot, reports no error or power loss and axes stay
+        at saved positions. STAMP sequence of saved session is continued on success.
+        :param path: Path to session file.
+        :param tolerance: Max difference of axis position from saved one (IRC).
+        :return: Boolean, whether homing can be skipped.
+        """
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (IOError, ValueError):
+            print('Resume: no saved session, homing required.')
+            return False
+        if saved.get('description') != self.robot.description or saved.get('version') != self.version:
+            print('Resume: robot or firmware changed, homing required.')
+            return False
+        try:
+            self.query_status()
+        except Exception as e:
+            print('Resume: %s Homing required.' % e)
+            return False
+        state = self.session_state()
+        if saved.get('axes') != state['axes'] or \
+                np.any(np.abs(np.array(saved['positions']) - state['positions']) > tolerance):
+            print('Resume: axes positions changed, homing required.')
+            return False
+        self.stamp = saved.get('stamp', self.stamp)
+        print('Resume: controller state is valid, homing skipped.')
+        return True
+
     def reset_motors(self):
         """
         Reset motors of robot.
         """
         self.send_cmd("PURGE:\n")
+        self.coordmv_queue.reset()
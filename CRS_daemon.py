@@ -0,0 +1,260 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' Module provides daemon owning serial port of control unit and its local client. '''
+
+# Usage examples:
+# Start daemon for CRS97 robot, initialize it unless its state is valid:
+#     python CRS_daemon.py -r CRS97 -d /dev/ttyUSB0 --init --resume
+# Use robot from other process:
+#     c = RobotClient()
+#     c.coordmv([0, 0, 0, 0, 0, 0])
+#     c.wait_ready()
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from CRS_commander import Commander
+
+# Default path of daemon socket
+SOCKET_PATH = '/tmp/mars8.sock'
+
+# Commander methods available to clients. Initialization may wait for ARM POWER
+# confirmation on daemon's terminal and session methods access arbitrary files,
+# so they are left to the daemon itself (--init, --resume).
+METHODS = frozenset([
+    'query', 'command', 'send_cmd', 'release', 'reset_motors',
+    'check_ready', 'query_status', 'wait_ready', 'wait_gripper_ready',
+    'hard_home', 'soft_home',
+    'set_speed_par', 'set_acc_par', 'set_max_speed', 'set_int_param_for_axes',
+    'setup_coordmv', 'coordmv', 'splinemv', 'move_to_pos', 'run_program',
+    'axis_get_pos', 'irctoangles', 'anglestoirc', 'find_closest_ikt',
+    'session_state',
+])
+
+
+def _decode(v):
+    """
+    Convert numeric lists received from client to NumPy arrays.
+    """
+    if isinstance(v, list):
+        a = np.array(v)
+        if a.dtype.kind in 'biuf':
+            return a
+    return v
+
+
+def _encode(v):
+    """
+    Convert NumPy values of result to JSON types.
+    """
+    if isinstance(v, np.ndarray):
+        return v.tolist()
+    if isinstance(v, np.generic):
+        return v.item()
+    raise TypeError('%r is not JSON serializable' % (v,))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    Serves one client connection. Each request is a JSON line
+    {"method": name, "args": [...], "kwargs": {...}} answered by JSON line
+    {"result": value} or {"error": message}. Method "lock" gives the connection
+    exclusive access to robot until "unlock" or disconnection.
+    """
+
+    def handle(self):
+        server = self.server
+        locked = 0
+        try:
+            for line in self.rfile:
+                try:
+                    req = json.loads(line.decode('utf-8'))
+                    method = req['method']
+                    if method == 'lock':
+                        server.lock.acquire()
+                        locked += 1
+                        resp = {'result': True}
+                    elif method == 'unlock':
+                        if not locked:
+                            raise RuntimeError('Robot is not locked by this client.')
+                        server.lock.release()
+                        locked -= 1
+                        resp = {'result': True}
+                    elif method in METHODS:
+                        args = [_decode(a) for a in req.get('args', [])]
+                        kwargs = dict((k, _decode(v)) for k, v in req.get('kwargs', {}).items())
+                        with server.lock:
+                            resp = {'result': getattr(server.commander, method)(*args, **kwargs)}
+                    else:
+                        raise AttributeError('Method %s is not available.' % method)
+                except Exception as e:
+                    resp = {'error': '%s: %s' % (type(e).__name__, e)}
+                self.wfile.write(json.dumps(resp, default=_encode).encode('utf-8') + b'\n')
+        finally:
+            for i in range(locked):
+                server.lock.release()
+
+
+class RobotDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Daemon owning a warm Commander and serving its methods through Unix socket,
+    so that several client processes can share one robot. Calls of different
+    clients are serialized by a lock.
+    """
+    daemon_threads = True
+
+    def __init__(self, commander, path=SOCKET_PATH):
+        """
+        RobotDaemon constructor.
+        :param commander: Commander with opened communication.
+        :param path: Path of Unix socket, stale socket is replaced, exception is raised
+                     when another daemon is serving it.
+        """
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except socket.error:
+                os.unlink(path)
+            else:
+                raise RuntimeError('Daemon is already serving %s.' % path)
+            finally:
+                probe.close()
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        self.commander = commander
+        self.lock = threading.RLock()
+        self.path = path
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class RobotClient(object):
+    """
+    Client of RobotDaemon. Whitelisted Commander methods are called as methods
+    of the client, e.g. client.coordmv(pos, min_time=100).
+    """
+
+    def __init__(self, path=SOCKET_PATH):
+        """
+        RobotClient constructor.
+        :param path: Path of daemon's Unix socket.
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.rfile = self.sock.makefile('rb')
+
+    def call(self, method, *args, **kwargs):
+        """
+        Call method of daemon's Commander.
+        :param method: Name of method.
+        :return: Result of method, exception is raised if the method failed.
+        """
+        req = {'method': method, 'args': args, 'kwargs': kwargs}
+        self.sock.sendall(json.dumps(req, default=_encode).encode('utf-8') + b'\n')
+        line = self.rfile.readline()
+        if not line:
+            raise EOFError('Robot daemon closed connection.')
+        resp = json.loads(line.decode('utf-8'))
+        if 'error' in resp:
+            raise Exception(resp['error'])
+        return resp['result']
+
+    def __getattr__(self, name):
+        if name not in METHODS:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Context manager giving the client exclusive access to robot inside the block.
+        """
+        self.call('lock')
+        try:
+            yield self
+        finally:
+            self.call('unlock')
+
+    def close(self):
+        """
+        Close connection to daemon.
+        """
+        self.rfile.close()
+        self.sock.close()
+
+
+if __name__ == '__main__':
+    from robotBosch import robotBosch
+    from robotCRS import robCRS93, robCRS97
+    from CRS_simulator import Mars8Simulator
+
+    parser = argparse.ArgumentParser(description='MARS8 robot daemon')
+    parser.add_argument('-d', '--tty-device', dest='tty_dev', type=str,
+                        default='/dev/ttyUSB0', help='tty device to robot, sim for simulated control unit')
+    parser.add_argument('-r', '--robot', dest='robot', type=str,
+                        help='type of robot\n{CRS97, CRS93, Bosch}', required=True)
+    parser.add_argument('-s', '--socket', dest='socket', type=str, default=SOCKET_PATH,
+                        help='path of Unix socket')
+    parser.add_argument('--init', dest='init', action='store_true', default=False,
+                        help='initialize robot before serving clients')
+    parser.add_argument('--resume', dest='resume', action='store_true', default=False,
+                        help='skip homing when control unit kept its state since last session')
+    args = parser.parse_args()
+
+    robot = {'CRS97': robCRS97, 'CRS93': robCRS93, 'Bosch': robotBosch}[args.robot]()
+    commander = Commander(robot)
+    if args.tty_dev == 'sim':
+        if getattr(robot, 'REGPWRON', 0):
+            robot.REGPWRON = 0  # simulated unit has no ARM POWER button
+        commander.set_rcon(Mars8Simulator(baudrate=19200))
+        commander.init_communication()
+    else:
+        commander.open_comm(args.tty_dev, speed=19200)
+    if args.init:
+        commander.init(resume=args.resume)
+
+    server = RobotDaemon(commander, args.socket)
+    print('Serving robot at %s' % args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.resume:
+            commander.save_session()
+        server.server_close()
@@ -0,0 +1,237 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' Module provides planning of spline streams limited by serial link bandwidth. '''
+
+import numpy as np
+
+from utils import param_correction
+
+# Bits per transmitted character: start bit, 8 data bits and stop bit
+CHAR_BITS = 10
+
+# Number of samples per segment used to check accuracy of merged segments
+_SAMPLES = 8
+
+
+def segment_bytes(param, order, min_time):
+    """
+    Number of bytes of COORDSPLINET command of a segment.
+    :param param: Parameters of spline segment.
+    :param order: Order of spline.
+    :param min_time: Minimal time of segment (ms).
+    :return: Length of command in bytes.
+    """
+    return len('COORDSPLINET:%d,%d,%s\n' % (int(round(min_time)), order,
+                                            ','.join([str(int(round(p))) for p in param])))
+
+
+class _Segment(object):
+    """
+    Segment of planned stream: spline coefficients relative to segment start, duration,
+    samples of original trajectory it replaces and predicted link/execution timing.
+    Duration 0 is an untimed segment carried in minimal possible time.
+    """
+    __slots__ = ('coef', 'duration', 'times', 'points', 'count', 'nbytes', 'tx_end', 'exec_end', 'gap')
+
+    def __init__(self, coef, duration, times, points, count=1):
+        self.coef = coef            # (n_axes, order) coefficients of s, s^2, ...
+        self.duration = duration    # ms
+        self.times = times          # sample times relative to segment start (ms)
+        self.points = points        # (n_samples, n_axes) original positions relative to segment start
+        self.count = count          # number of original segments
+        self.nbytes = 0
+        self.tx_end = 0.0
+        self.exec_end = 0.0
+        self.gap = 0.0
+
+    @classmethod
+    def from_param(cls, param, order, duration):
+        coef = np.reshape(np.asarray(param, dtype=float), (-1, order))
+        s = np.linspace(0.0, 1.0, _SAMPLES + 1)[1:]
+        return cls(coef, float(duration), s * duration, _evaluate(coef, s))
+
+    def delta(self):
+        return self.coef.sum(axis=1)
+
+    def exec_time(self, speed):
+        """
+        Predicted execution time (s), minimal time or time given by axis speed limits.
+        """
+        if speed is None:
+            return self.duration / 1000.0
+        return max(self.duration, float(np.max(np.abs(self.delta()) / speed))) / 1000.0
+
+
+def _evaluate(coef, s):
+    """
+    Evaluate spline segment.
+    :param coef: (n_axes, order) coefficients of s, s^2, ...
+    :param s: Array of normalized times in <0;1>.
+    :return: (len(s), n_axes) positions relative to segment start.
+    """
+    powers = np.power.outer(s, np.arange(1, coef.shape[1] + 1))
+    return powers.dot(coef.T)
+
+
+def _merge(a, b, order):
+    """
+    Merge two consecutive segments into one refitted by least squares to samples of
+    the original trajectory, end point of the merged segment is kept exact. Both
+    segments must be timed, samples of untimed segments have no time base.
+    :return: Tuple of merged segment and max deviation from original samples.
+    """
+    duration = a.duration + b.duration
+    times = np.concatenate((a.times, b.times + a.duration))
+    points = np.vstack((a.points, b.points + a.points[-1]))
+    delta = points[-1]
+    s = times / duration
+    # p(s) = delta * s^order + sum_{r<order} c_r (s^r - s^order)
+    powers = np.power.outer(s, np.arange(1, order + 1))
+    A = powers[:, :-1] - powers[:, -1:]
+    rhs = points - np.outer(powers[:, -1], delta)
+    c = np.linalg.lstsq(A, rhs, rcond=None)[0]
+    coef = np.empty((len(delta), order))
+    coef[:, :-1] = c.T
+    coef[:, -1] = delta - c.sum(axis=0)
+    coef = np.round(coef)
+    coef[:, -1] += delta - coef.sum(axis=1)
+    merged = _Segment(coef, duration, times, points, a.count + b.count)
+    return merged, np.max(np.abs(_evaluate(coef, s) - points))
+
+
+def _place(out, seg, order, baudrate, queue_size, speed=None):
+    """
+    Predict transmission and execution of segment following segments in out. Segment
+    is sent after the previous one when the coordinated movement queue has space,
+    its execution starts when it is received and the previous one is finished.
+    Gap is time the queue runs empty before the segment is received.
+    """
+    seg.nbytes = segment_bytes(seg.coef.ravel(), order, seg.duration)
+    tx_start = out[-1].tx_end if out else 0.0
+    if len(out) >= queue_size:
+        tx_start = max(tx_start, out[-queue_size].exec_end)
+    seg.tx_end = tx_start + seg.nbytes * CHAR_BITS / float(baudrate)
+    if out:
+        seg.gap = max(0.0, seg.tx_end - out[-1].exec_end)
+        seg.exec_end = max(out[-1].exec_end, seg.tx_end) + seg.exec_time(speed)
+    else:
+        seg.gap = 0.0
+        seg.exec_end = seg.tx_end + seg.exec_time(speed)
+
+
+def _min_times(min_times, n):
+    if np.isscalar(min_times):
+        return np.full(n, float(min_times))
+    return np.asarray(min_times, dtype=float)
+
+
+def predict_underruns(params, order, min_times, baudrate=19200, queue_size=20, speed=None):
+    """
+    Predict points where streaming of spline segments does not keep up with their
+    execution and the coordinated movement queue of control unit runs empty.
+    :param params: Parameters of spline segments, one row per segment.
+    :param order: Order of spline.
+    :param min_times: Minimal time of segments (ms), scalar or one per segment.
+    :param baudrate: Baud rate of serial link.
+    :param queue_size: Size of coordinated movement queue of control unit.
+    :param speed: Axis speed limits (IRC/ms), scalar or one per axis, used to predict duration
+                  of segments, None to take minimal times only (untimed segments take no time).
+    :return: List of tuples (segment index, time the robot waits for the segment (s)).
+    """
+    min_times = _min_times(min_times, len(params))
+    out = []
+    underruns = []
+    for i in range(len(params)):
+        seg = _Segment.from_param(params[i], order, min_times[i])
+        _place(out, seg, order, baudrate, queue_size, speed)
+        out.append(seg)
+        if seg.gap > 0:
+            underruns.append((i, seg.gap))
+    return underruns
+
+
+def plan_stream(params, order, min_times, baudrate=19200, queue_size=20, tolerance=2.0, max_merge=16,
+                speed=None):
+    """
+    Make spline stream sustainable on serial link. A segment received after the previous
+    one finished is merged with the previous segment and the merged segment is refitted
+    to the original trajectory, until the segment arrives in time, the refit deviates more
+    than tolerance or max_merge original segments are merged. Untimed segments (minimal
+    time 0) are kept as they are.
+    :param params: Parameters of spline segments, one row per segment.
+    :param order: Order of spline.
+    :param min_times: Minimal time of segments (ms), scalar or one per segment.
+    :param baudrate: Baud rate of serial link.
+    :param queue_size: Size of coordinated movement queue of control unit.
+    :param tolerance: Max deviation of merged segments from original trajectory (IRC).
+    :param max_merge: Max number of original segments merged into one.
+    :param speed: Axis speed limits (IRC/ms), scalar or one per axis, used to predict duration
+                  of segments, None to take minimal times only (untimed segments take no time).
+    :return: Tuple of parameters and minimal times of planned segments and list of
+             remaining underruns (planned segment index, time the robot waits for the segment (s)).
+    """
+    params = np.asarray(params)
+    if len(params) == 0:
+        return np.empty((0, params.shape[1] if params.ndim == 2 else 0)), np.empty(0), []
+    min_times = _min_times(min_times, len(params))
+    out = []
+    for i in range(len(params)):
+        seg = _Segment.from_param(params[i], order, min_times[i])
+        _place(out, seg, order, baudrate, queue_size, speed)
+        while seg.gap > 0 and out and out[-1].count + seg.count <= max_merge \
+                and out[-1].duration > 0 and seg.duration > 0:
+            merged, err = _merge(out[-1], seg, order)
+            if err > tolerance:
+                break
+            out.pop()
+            seg = merged
+            _place(out, seg, order, baudrate, queue_size, speed)
+        out.append(seg)
+
+    planned = np.array([seg.coef.ravel() for seg in out])
+    planned = param_correction(np.zeros(planned.shape[1] // order), planned, order)
+    underruns = [(i, seg.gap) for i, seg in enumerate(out) if seg.gap > 0]
+    return planned, np.array([seg.duration for seg in out]), underruns
+
+
+def report_underruns(underruns, min_times=None):
+    """
+    Print predicted underruns.
+    :param underruns: List of tuples (segment index, wait time (s)).
+    :param min_times: Minimal times of segments (ms), printed when given.
+    """
+    if not underruns:
+        print('Stream is sustainable, no underrun predicted.')
+        return
+    print('Predicted %d underruns, robot waits %.3f s in total:'
+          % (len(underruns), sum([g for i, g in underruns])))
+    for i, g in underruns:
+        if min_times is not None:
+            print('  segment %d (%.1f ms): waits %.1f ms' % (i, min_times[i], g * 1000))
+        else:
+            print('  segment %d: waits %.1f ms' % (i, g * 1000))
@@ -0,0 +1,134 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' Module provides precompiled command streams (motion programs) for spline trajectories. '''
+
+import mmap
+import struct
+
+import numpy as np
+
+MAGIC = b'MARS8PRG'
+VERSION = 1
+
+# magic, version, order, number of axes, number of segments, length of prologue
+_HEADER = struct.Struct('<8sHHHxxII')
+
+
+class Program(object):
+    """
+    Memory-mapped motion program. File consists of header, start and end position
+    of coordinated axes (int32), segment index (uint32 offsets of segment commands
+    and minimal times in ms) and command data. Data starts with prologue lines
+    'COORDGRP', start 'COORDMV' and 'COORDISCONT' followed by 'COORDSPLINET'
+    commands of all segments.
+    """
+
+    def __init__(self, path):
+        """
+        Program constructor, maps program file to memory.
+        :param path: Path to program file.
+        """
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.order, n_axes, self.n_segments, head_len = _HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a motion program of version %d.' % (path, VERSION))
+        off = _HEADER.size
+        self.start = np.frombuffer(self.mm, dtype='<i4', count=n_axes, offset=off)
+        off += 4 * n_axes
+        self.end = np.frombuffer(self.mm, dtype='<i4', count=n_axes, offset=off)
+        off += 4 * n_axes
+        self.offsets = np.frombuffer(self.mm, dtype='<u4', count=self.n_segments + 1, offset=off)
+        off += 4 * (self.n_segments + 1)
+        self.min_times = np.frombuffer(self.mm, dtype='<u4', count=self.n_segments, offset=off)
+        off += 4 * self.n_segments
+        grp, start, disc = self.mm[off:off + head_len].split(b'\n')[:3]
+        self.coordgrp = grp + b'\n'
+        self.start_cmd = start + b'\n'
+        self.disc_cmd = disc + b'\n'
+        self.axes = grp[grp.index(b':') + 1:].decode('ascii').replace(',', '')
+        self.disc = int(disc[disc.index(b':') + 1:])
+        self.data = off + head_len
+
+    def __len__(self):
+        return self.n_segments
+
+    def segments(self, i, j):
+        """
+        Commands of segments i to j-1.
+        :param i: First segment.
+        :param j: Segment after the last one.
+        :return: Command bytes.
+        """
+        return self.mm[self.data + int(self.offsets[i]):self.data + int(self.offsets[j])]
+
+    def close(self):
+        # arrays are views of the map and must be released first
+        self.start = self.end = self.offsets = self.min_times = None
+        self.mm.close()
+
+
+def compile_program(path, axes, start, params, order=3, min_time=None, disc=5):
+    """
+    Compile spline trajectory into motion program file.
+    :param path: Path to output program file.
+    :param axes: Coordinated axes, e.g. 'ABCDEF'.
+    :param start: Start position of trajectory in IRC.
+    :param params: Parameters of spline segments, one row per segment (see interpolation).
+    :param order: Order of spline.
+    :param min_time: Minimal time of segments (ms), scalar, sequence with value for each segment or None.
+    :param disc: Discontinuity of movement, internal parameter, is to be found in control unit docs.
+    :return: Number of compiled segments.
+    """
+    start = np.rint(np.asarray(start, dtype=float)).astype(np.int64)
+    params = np.rint(np.atleast_2d(np.asarray(params, dtype=float))).astype(np.int64)
+    n = params.shape[0] if params.size else 0
+    if params.size and params.shape[1] != len(axes) * order:
+        raise ValueError('Wrong number of spline parameters (%d, should be %d).' % (params.shape[1], len(axes) * order))
+    if min_time is None:
+        min_time = 0
+    times = np.rint(np.broadcast_to(np.asarray(min_time, dtype=float), (n,))).astype(np.uint32)
+    end = start + (params.reshape((n, len(axes), order)).sum(axis=(0, 2)) if n else 0)
+
+    head = ('COORDGRP:%s\n' % ','.join(axes) +
+            'COORDMV:%s\n' % ','.join(str(p) for p in start) +
+            'COORDISCONT:%d\n' % disc).encode('ascii')
+    lines = [('COORDSPLINET:%d,%d,%s\n' % (t, order, ','.join(str(p) for p in row))).encode('ascii')
+             for t, row in zip(times, params)]
+    offsets = np.zeros(n + 1, dtype='<u4')
+    offsets[1:] = np.cumsum([len(l) for l in lines])
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, order, len(axes), n, len(head)))
+        f.write(start.astype('<i4').tobytes())
+        f.write(end.astype('<i4').tobytes())
+        f.write(offsets.tobytes())
+        f.write(times.astype('<u4').tobytes())
+        f.write(head)
+        f.write(b''.join(lines))
+    return n
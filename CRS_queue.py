@@ -0,0 +1,108 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' Module provides occupancy model of the control unit's coordinated movement queue. '''
+
+import collections
+import time
+
+
+class CoordmvQueue(object):
+    """
+    Model of the MARS8 coordinated movement queue. Segments sent to the control unit
+    are counted against segments predicted to be completed from their durations,
+    the prediction is corrected by 'ST' responses.
+    """
+
+    def __init__(self, size=20, margin=2, segment_time=0.05):
+        """
+        CoordmvQueue constructor.
+        :param size: Capacity of the coordinated movement queue in segments.
+        :param margin: Number of free slots kept in the queue.
+        :param segment_time: Estimated duration of segment without specified time (s).
+        """
+        self.size = size
+        self.margin = margin
+        self.segment_time = segment_time
+        self.finish = collections.deque()
+
+    def depth(self, now=None):
+        """
+        Predicted number of segments queued in control unit.
+        :param now: Time of prediction (time.monotonic()), current time if None.
+        :return: Number of queued segments.
+        """
+        if now is None:
+            now = time.monotonic()
+        while self.finish and self.finish[0] <= now:
+            self.finish.popleft()
+        return len(self.finish)
+
+    def limit(self):
+        """
+        Number of segments the queue is kept filled with.
+        """
+        return self.size - self.margin
+
+    def drain_time(self, depth):
+        """
+        Predicted time when number of queued segments drops to depth.
+        :param depth: Number of segments.
+        :return: Time (time.monotonic()).
+        """
+        n = len(self.finish)
+        if n <= depth:
+            return 0.0
+        return self.finish[n - depth - 1]
+
+    def push(self, duration=None, now=None):
+        """
+        Account segment sent to control unit.
+        :param duration: Duration of segment (s), estimate is used if None.
+        :param now: Time of sending (time.monotonic()), current time if None.
+        """
+        if now is None:
+            now = time.monotonic()
+        if not duration:
+            duration = self.segment_time
+        start = self.finish[-1] if self.finish and self.finish[-1] > now else now
+        self.finish.append(start + duration)
+
+    def mark_full(self, now=None):
+        """
+        Correct prediction after control unit reported full queue. Missing segments
+        are accounted with estimated duration.
+        :param now: Time of report (time.monotonic()), current time if None.
+        """
+        while self.depth(now) < self.size:
+            self.push(now=now)
+
+    def reset(self):
+        """
+        Mark queue empty, e.g. after control unit reported ready state.
+        """
+        self.finish.clear()
@@ -0,0 +1,348 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' Module provides recording and replay of serial sessions with control unit. '''
+
+import collections
+import re
+import time
+
+MAGIC = b'MARS8LOG\x01'
+
+WRITE = b'W'
+READ = b'R'
+
+_STAMP_CMD = re.compile(br'STAMP:(\d+)')
+_STAMP_RESP = re.compile(br'STAMP=(\d+)')
+
+
+def _lines(data):
+    return data.replace(b'\r', b'\n').split(b'\n')
+
+
+def _response_key(line):
+    """
+    Key of response expected for command line: query 'X?' is answered 'X=...',
+    'STAMP:n' with 'STAMP=n' and 'R:', 'R<axis>:' with 'R!', 'R<axis>!'.
+    :return: Key or None if no response is expected.
+    """
+    if line.endswith(b'?'):
+        return line[:-1]
+    name, sep, args = line.partition(b':')
+    if name == b'STAMP' or (sep and not args and name[:1] == b'R' and len(name) <= 2):
+        return name
+    return None
+
+
+def _put_varint(buf, v):
+    while v >= 0x80:
+        buf.append((v & 0x7f) | 0x80)
+        v >>= 7
+    buf.append(v)
+
+
+def _get_varint(data, i):
+    v = 0
+    shift = 0
+    while True:
+        b = data[i]
+        i += 1
+        v |= (b & 0x7f) << shift
+        if b < 0x80:
+            return v, i
+        shift += 7
+
+
+def load_log(path):
+    """
+    Load recorded session.
+    :param path: Path to session log.
+    :return: List of records (kind, time in s from start, data), kind is WRITE or READ.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError('%s is not a session log.' % path)
+    records = []
+    i = len(MAGIC)
+    t = 0
+    while i < len(data):
+        kind = data[i:i + 1]
+        dt, i = _get_varint(data, i + 1)
+        n, i = _get_varint(data, i)
+        t += dt
+        records.append((kind, t * 1e-6, data[i:i + n]))
+        i += n
+    return records
+
+
+def log_summary(records):
+    """
+    Summarize recorded session.
+    :param records: Records returned by load_log().
+    :return: Dictionary with duration, numbers of bytes and commands and command throughput.
+    """
+    duration = records[-1][1] if records else 0.0
+    written = b''.join(r[2] for r in records if r[0] == WRITE)
+    read = sum(len(r[2]) for r in records if r[0] == READ)
+    commands = len([l for l in written.split(b'\n') if l.strip()])
+    return {
+        'duration': duration,
+        'writes': len([r for r in records if r[0] == WRITE]),
+        'bytes_written': len(written),
+        'bytes_read': read,
+        'commands': commands,
+        'commands_per_s': commands / duration if duration > 0 else 0.0,
+    }
+
+
+class RecordingTransport(object):
+    """
+    Serial interface wrapper recording every write and non-empty read with monotonic
+    timestamps into a compact binary log. Record consists of kind byte, time delta
+    in microseconds and data length (both varint) and data.
+    """
+
+    def __init__(self, rcon, path):
+        """
+        RecordingTransport constructor.
+        :param rcon: Serial interface to wrap.
+        :param path: Path to session log.
+        """
+        self.__dict__['rcon'] = rcon
+        self.__dict__['log'] = open(path, 'wb')
+        self.__dict__['t0'] = time.monotonic()
+        self.__dict__['last'] = 0
+        self.log.write(MAGIC)
+
+    def __getattr__(self, name):
+        return getattr(self.rcon, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.rcon, name, value)
+
+    def _record(self, kind, data):
+        t = int((time.monotonic() - self.t0) * 1e6)
+        buf = bytearray(kind)
+        _put_varint(buf, t - self.last)
+        _put_varint(buf, len(data))
+        buf += data
+        self.log.write(buf)
+        self.__dict__['last'] = t
+
+    def write(self, data):
+        self._record(WRITE, bytes(data))
+        return self.rcon.write(data)
+
+    def read(self, size=1):
+        data = self.rcon.read(size)
+        if data:
+            self._record(READ, data)
+        return data
+
+    def close(self):
+        self.log.close()
+        self.rcon.close()
+
+
+class ReplayTransport(object):
+    """
+    Serial interface feeding recorded control unit responses back to the commander.
+
+    In real time mode response is released only after the commander wrote all bytes
+    preceding it in the log, with the recorded delay after that write. Stamps sent by
+    the commander are mapped to the recorded ones, as they are derived from time.
+    Written bytes are compared to the recorded ones, number of diverging writes is
+    counted, exception is raised when the commander waits for a response the log
+    cannot provide.
+
+    Fast mode answers every command expecting a response immediately with the next
+    recorded response for the same command (the last one when they run out), so the
+    time dependent number of queries (e.g. 'ST?' of coordmv queue throttling) does not
+    matter. Only command lines without response are compared to the recorded ones.
+    """
+
+    def __init__(self, path, realtime=True, timeout=0.01, stall_timeout=1.0):
+        """
+        ReplayTransport constructor.
+        :param path: Path to session log.
+        :param realtime: Boolean, whether to keep recorded response timing, otherwise fast mode.
+        :param timeout: Read timeout (s).
+        :param stall_timeout: Time after which diverged commander waiting for response is reported (s).
+        """
+        self.records = load_log(path)
+        self.realtime = realtime
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.expected = b''.join(r[2] for r in self.records if r[0] == WRITE)
+        self.stamps = _STAMP_CMD.findall(self.expected)
+        self.stamp_map = {}
+        self.written = 0
+        self.mismatches = 0
+        self.diverged_at = None
+        self.pos = 0
+        self.consumed = 0
+        self.write_time = time.monotonic()
+        self.ref = (self.write_time, 0.0)
+        self.out = bytearray()
+        self.next_read = None
+        if not realtime:
+            self._index_responses()
+
+    def _index_responses(self):
+        """
+        Assign recorded responses to commands for fast mode. Response is matched to
+        the oldest command waiting for it, 'FAIL!' to the oldest waiting command.
+        """
+        self.responses = collections.defaultdict(collections.deque)
+        self.last_response = {}
+        self.commands = []
+        self.line = b''
+        self.cmd_pos = 0
+        pending = []
+        partial = {WRITE: b'', READ: b''}
+        for kind, t, data in self.records:
+            lines = _lines(partial[kind] + data)
+            partial[kind] = lines.pop()
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                if kind == WRITE:
+                    key = _response_key(line)
+                    if key is None:
+                        self.commands.append(line)
+                    else:
+                        pending.append(key)
+                    continue
+                if line == b'FAIL!':
+                    key = pending[0] if pending else None
+                elif b'=' in line:
+                    key = line.partition(b'=')[0]
+                elif line.endswith(b'!'):
+                    key = line[:-1]
+                else:
+                    continue
+                if key in pending:
+                    pending.remove(key)
+                    self.responses[key].append(line)
+
+    def _advance(self):
+        now = time.monotonic()
+        self.next_read = None
+        while self.pos < len(self.records):
+            kind, t, data = self.records[self.pos]
+            if kind == WRITE:
+                if self.written < self.consumed + len(data):
+                    break
+                self.consumed += len(data)
+                # responses are timed relative to the write which completed the record
+                self.ref = (self.write_time, t)
+            else:
+                at = self.ref[0] + (t - self.ref[1] if self.realtime else 0.0)
+                if at > now:
+                    self.next_read = at
+                    break
+                self.out += _STAMP_RESP.sub(self._map_stamp, data)
+            self.pos += 1
+
+    def _map_stamp(self, m):
+        return b'STAMP=' + self.stamp_map.get(m.group(1), m.group(1))
+
+    def _recorded_stamp(self, m):
+        if len(self.stamp_map) >= len(self.stamps):
+            return m.group(0)
+        recorded = self.stamps[len(self.stamp_map)]
+        self.stamp_map[recorded] = m.group(1)
+        return b'STAMP:' + recorded
+
+    def write(self, data):
+        if not self.realtime:
+            return self._write_fast(data)
+        n = len(data)
+        data = _STAMP_CMD.sub(self._recorded_stamp, bytes(data))
+        exp = self.expected[self.written:self.written + len(data)]
+        if exp != data:
+            self.mismatches += 1
+            if self.diverged_at is None:
+                self.diverged_at = self.written
+        self.written += len(data)
+        self.write_time = time.monotonic()
+        self._advance()
+        return n
+
+    def _write_fast(self, data):
+        lines = _lines(self.line + bytes(data))
+        self.line = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            key = _response_key(line)
+            if key is None:
+                if self.cmd_pos >= len(self.commands) or self.commands[self.cmd_pos] != line:
+                    self.mismatches += 1
+                    if self.diverged_at is None:
+                        self.diverged_at = self.written
+                self.cmd_pos += 1
+            elif key == b'STAMP':
+                self.out += b'STAMP=' + line.partition(b':')[2] + b'\r\n'
+            else:
+                if self.responses[key]:
+                    self.last_response[key] = self.responses[key].popleft()
+                elif key not in self.last_response:
+                    raise RuntimeError('Replay has no response to \'%s\'.' % line.decode('ascii', 'replace'))
+                self.out += self.last_response[key] + b'\r\n'
+        self.written += len(data)
+        return len(data)
+
+    def read(self, size=1):
+        if not self.realtime:
+            if not self.out:
+                time.sleep(self.timeout)
+            data = bytes(self.out[:size])
+            del self.out[:size]
+            return data
+        deadline = time.monotonic() + self.timeout
+        while True:
+            self._advance()
+            if self.out:
+                data = bytes(self.out[:size])
+                del self.out[:size]
+                return data
+            if self.pos >= len(self.records):
+                raise EOFError('Replay log exhausted.')
+            now = time.monotonic()
+            if self.diverged_at is not None and self.next_read is None and \
+                    now - self.write_time > self.stall_timeout:
+                raise RuntimeError('Replay diverged from recording at byte %d.' % self.diverged_at)
+            if now >= deadline:
+                return b''
+            time.sleep(min(deadline, self.next_read or deadline) - now)
+
+    def close(self):
+        pass
@@ -0,0 +1,110 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' Module provides incremental line framing of control unit responses. '''
+
+import collections
+
+
+class ResponseBuffer(object):
+    """
+    Incremental line-framed parser of the MARS8 response stream.
+    Received bytes are scanned for line terminators only once, complete lines
+    are decoded and replies are indexed by key ('ST' for 'ST=...', whole line for 'R!').
+    Other lines, such as echoed commands, are returned but not indexed.
+    """
+
+    def __init__(self, indexed=True, history=64):
+        """
+        ResponseBuffer constructor.
+        :param indexed: Boolean, whether to index complete lines by key.
+        :param history: Max number of unconsumed values kept for one key.
+        """
+        self.data = bytearray()
+        self.indexed = indexed
+        self.history = history
+        self.index = {}
+
+    def feed(self, data):
+        """
+        Append received bytes and split complete lines.
+        :param data: Bytes read from control unit.
+        :return: List of new complete lines, without line terminators.
+        """
+        if not data:
+            return []
+        start = len(self.data)
+        self.data += data.replace(b'\r', b'\n')
+        end = self.data.rfind(b'\n', start)
+        if end < 0:
+            return []
+        lines = [l.decode('ascii') for l in self.data[:end].split(b'\n') if l]
+        # deleting from the front of bytearray is amortized O(1)
+        del self.data[:end + 1]
+        if self.indexed:
+            for line in lines:
+                self._index(line)
+        return lines
+
+    def _index(self, line):
+        # only replies are indexed, echoed commands and other lines would grow the index without bound
+        i = line.find('=')
+        if i >= 0:
+            key, val = line[:i], line[i + 1:]
+        elif line.endswith('!'):
+            key, val = line, ''
+        else:
+            return
+        q = self.index.get(key)
+        if q is None:
+            q = self.index[key] = collections.deque(maxlen=self.history)
+        q.append(val)
+
+    def take(self, key):
+        """
+        Remove and return the oldest value received for the key.
+        :param key: Response key, e.g. 'ST', 'STAMP' or 'R!'.
+        :return: Value after '=' ('' for lines without value) or None if not received.
+        """
+        q = self.index.get(key)
+        if not q:
+            return None
+        return q.popleft()
+
+    def discard(self, key):
+        """
+        Drop all values received for the key.
+        :param key: Response key.
+        """
+        self.index.pop(key, None)
+
+    def clear(self):
+        """
+        Drop partial line and all indexed values.
+        """
+        del self.data[:]
+        self.index.clear()
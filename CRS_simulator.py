@@ -0,0 +1,392 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' Module provides simulator of Mars 8 control unit usable in place of serial interface. '''
+
+import collections
+import time
+
+import numpy as np
+
+
+class _Segment(object):
+    """ Coordinated movement segment queued in simulated control unit. """
+    __slots__ = ('coef', 'min_time', 'start', 'duration', 'end')
+
+    def __init__(self, coef, min_time):
+        self.coef = coef            # (order, n) polynomial coefficients relative to start
+        self.min_time = min_time    # s
+        self.start = None
+        self.duration = None
+        self.end = None
+
+    def pos(self, p0, t):
+        s = min(max((t - self.start) / self.duration, 0.0), 1.0) if self.duration > 0 else 1.0
+        return p0 + np.dot(s ** np.arange(1, self.coef.shape[0] + 1), self.coef)
+
+
+class Mars8Simulator(object):
+    """
+    Simulated Mars 8 control unit with serial.Serial read/write/timeout interface.
+    Simulation models bounded coordinated movement queue, segment execution time
+    derived from minimal time and axis speed limits, and baud rate limited
+    throughput in both directions. Commands which do not fit into the unit's
+    buffer block the writer as RTS/CTS flow control does.
+    """
+
+    ST_ERROR = 0x8
+    ST_BUSY = 0x10
+    ST_COORD_FULL = 0x80
+
+    def __init__(self, baudrate=19200, timeout=0.01, queue_size=20, buffer_size=4096,
+                 axes='ABCDEFGH', home_time=1.0, time_scale=1.0, version='MARS8 simulator'):
+        """
+        Mars8Simulator constructor.
+        :param baudrate: Simulated baud rate, None for unlimited throughput.
+        :param timeout: Read timeout (s).
+        :param queue_size: Capacity of coordinated movement queue in segments.
+        :param buffer_size: Number of unprocessed bytes accepted before write blocks.
+        :param axes: Axes letters of control unit.
+        :param home_time: Duration of hard homing of one axis (s).
+        :param time_scale: Speed of simulated time relative to real time.
+        :param version: Firmware version reported by 'VER?'.
+        """
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.queue_size = queue_size
+        self.buffer_size = buffer_size
+        self.axes = axes
+        self.home_time = home_time
+        self.time_scale = time_scale
+        self.version = version
+        self.is_open = True
+
+        self.t0 = time.monotonic()
+        self.pos = dict((a, 0.0) for a in axes)
+        self.regs = {}
+        self.echo = 1
+        self.error = False
+        self.coord_axes = ''
+        self.coord_pos = np.zeros(0)
+        self.coord_trgt = np.zeros(0)
+        self.queue = collections.deque()
+        self.axis_moves = {}        # axis -> (start, end, p0, p1)
+        self.ready_waiters = []     # axes letters of pending 'R:' commands
+        self.inp = collections.deque()  # (arrival time, line)
+        self.inp_bytes = 0
+        self.partial = b''
+        self.rx_free = 0.0
+        self.out = collections.deque()  # (ready time, bytes)
+        self.tx_free = 0.0
+
+    # time
+
+    def now(self):
+        """
+        Simulated time (s).
+        """
+        return (time.monotonic() - self.t0) * self.time_scale
+
+    def _sleep_until(self, t):
+        dt = (t - self.now()) / self.time_scale
+        if dt > 0:
+            time.sleep(dt)
+
+    def _byte_time(self, n):
+        return n * 10.0 / self.baudrate if self.baudrate else 0.0
+
+    # serial.Serial interface
+
+    def write(self, data):
+        """
+        Send bytes to simulated control unit.
+        :param data: Bytes to send.
+        :return: Number of bytes written.
+        """
+        data = bytes(data)
+        now = self.now()
+        self.rx_free = max(self.rx_free, now)
+        # bytes of partial line were already transmitted by previous write
+        done = -len(self.partial)
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        for line in lines:
+            done += len(line) + 1
+            self.inp.append((self.rx_free + self._byte_time(done), line.strip(b'\r').decode('ascii')))
+            self.inp_bytes += len(line) + 1
+        self.rx_free += self._byte_time(len(data))
+        while True:
+            self._advance(self.now())
+            if self.inp_bytes <= self.buffer_size:
+                break
+            self._sleep_until(self._next_event())
+        return len(data)
+
+    def read(self, size=1):
+        """
+        Read response bytes from simulated control unit.
+        :param size: Max number of bytes to read.
+        :return: Bytes read, empty if nothing was received before timeout.
+        """
+        deadline = self.now() + (self.timeout * self.time_scale if self.timeout is not None else float('inf'))
+        while True:
+            now = self.now()
+            self._advance(now)
+            if self.out and self.out[0][0] <= now:
+                break
+            if now >= deadline:
+                return b''
+            self._sleep_until(min(deadline, self._next_event()))
+        res = bytearray()
+        while self.out and self.out[0][0] <= now and len(res) < size:
+            t, b = self.out.popleft()
+            if len(res) + len(b) > size:
+                n = size - len(res)
+                self.out.appendleft((t, b[n:]))
+                b = b[:n]
+            res += b
+        return bytes(res)
+
+    @property
+    def in_waiting(self):
+        now = self.now()
+        self._advance(now)
+        return sum(len(b) for t, b in self.out if t <= now)
+
+    def reset_input_buffer(self):
+        self._advance(self.now())
+        self.out.clear()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+    # simulation
+
+    def _respond(self, t, s):
+        self.tx_free = max(self.tx_free, t) + self._byte_time(len(s) + 2)
+        self.out.append((self.tx_free, (s + '\r\n').encode('ascii')))
+
+    def _speed(self, axis):
+        # REGMS is in IRC/256/ms
+        return float(self.regs.get('REGMS' + axis, 10000)) / 256.0 * 1000.0
+
+    def _start_segment(self, t):
+        seg = self.queue[0]
+        delta = np.sum(seg.coef, axis=0)
+        speed = np.array([self._speed(a) for a in self.coord_axes])
+        seg.start = t
+        seg.duration = max(seg.min_time, float(np.max(np.abs(delta) / speed)) if len(delta) else 0.0)
+        seg.end = t + seg.duration
+
+    def _next_event(self):
+        t = float('inf')
+        if self.queue:
+            t = self.queue[0].end
+        for m in self.axis_moves.values():
+            t = min(t, m[1])
+        if self.inp:
+            t = min(t, self._line_time())
+        if self.out:
+            t = min(t, self.out[0][0])
+        return t
+
+    def _line_time(self):
+        t, line = self.inp[0]
+        if line.startswith('COORD') and self._coord_queue_full():
+            t = max(t, self.queue[0].end)
+        return t
+
+    def _coord_queue_full(self):
+        return len(self.queue) >= self.queue_size
+
+    def _busy(self, axis=''):
+        if axis:
+            return axis in self.axis_moves or (bool(self.queue) and axis in self.coord_axes)
+        return bool(self.queue) or bool(self.axis_moves)
+
+    def _advance(self, now):
+        while True:
+            t_seg = self.queue[0].end if self.queue else float('inf')
+            t_ax = min([m[1] for m in self.axis_moves.values()] or [float('inf')])
+            t_in = self._line_time() if self.inp else float('inf')
+            t = min(t_seg, t_ax, t_in)
+            if t > now:
+                break
+            if t == t_seg:
+                seg = self.queue.popleft()
+                self.coord_pos = self.coord_pos + np.sum(seg.coef, axis=0)
+                if self.queue:
+                    self._start_segment(t)
+            elif t == t_ax:
+                for a, m in list(self.axis_moves.items()):
+                    if m[1] <= t:
+                        del self.axis_moves[a]
+                        self._set_pos(a, m[3])
+            else:
+                arrival, line = self.inp.popleft()
+                self.inp_bytes -= len(line) + 1
+                if self.echo:
+                    self._respond(t, line)
+                self._process(t, line)
+            self._check_ready(t)
+
+    def _check_ready(self, t):
+        while self.ready_waiters and not self._busy(self.ready_waiters[0]):
+            self._respond(t, 'R%s!' % self.ready_waiters.pop(0))
+
+    def _axis_pos(self, axis, t):
+        if axis in self.axis_moves:
+            t0, t1, p0, p1 = self.axis_moves[axis]
+            return p0 + (p1 - p0) * min(max((t - t0) / (t1 - t0), 0.0), 1.0)
+        if axis in self.coord_axes:
+            p = self.coord_pos
+            if self.queue:
+                p = self.queue[0].pos(p, t)
+            return p[self.coord_axes.index(axis)]
+        return self.pos[axis]
+
+    def _stop(self, t):
+        for a in self.axes:
+            self.pos[a] = self._axis_pos(a, t)
+        self.queue.clear()
+        self.axis_moves.clear()
+        self.coord_pos = np.array([self.pos[a] for a in self.coord_axes])
+        self.coord_trgt = self.coord_pos.copy()
+
+    def _release(self, t, axis):
+        # released axis of coordinated group stops the whole group
+        if axis in self.coord_axes and self.queue:
+            self._stop(t)
+        elif axis in self.axis_moves:
+            p = self._axis_pos(axis, t)
+            del self.axis_moves[axis]
+            self._set_pos(axis, p)
+
+    def _set_pos(self, axis, p):
+        self.pos[axis] = p
+        if axis in self.coord_axes:
+            i = self.coord_axes.index(axis)
+            self.coord_pos[i] = p
+            self.coord_trgt[i] = p
+
+    def _coordgrp(self, args):
+        axes = ''.join(a.strip() for a in args.split(','))
+        if self.queue or not axes or any(a not in self.axes for a in axes):
+            raise ValueError(args)
+        for a, p in zip(self.coord_axes, self.coord_pos):
+            self.pos[a] = p
+        self.coord_axes = axes
+        self.coord_pos = np.array([self.pos[a] for a in axes])
+        self.coord_trgt = self.coord_pos.copy()
+
+    def _queue_segment(self, t, coef, min_time):
+        self.queue.append(_Segment(coef, min_time))
+        self.coord_trgt = self.coord_trgt + np.sum(coef, axis=0)
+        if len(self.queue) == 1:
+            self._start_segment(t)
+
+    def _process(self, t, line):
+        if not line:
+            return
+        try:
+            if line.endswith('?'):
+                self._respond(t, '%s=%s' % (line[:-1], self._query(t, line[:-1])))
+                return
+            name, _, args = line.partition(':')
+            if name == 'COORDGRP':
+                self._coordgrp(args)
+                return
+            args = [int(float(v)) for v in args.split(',') if v.strip()]
+            if not self._command(t, name, args):
+                self._respond(t, 'FAIL!')
+        except (ValueError, KeyError, IndexError):
+            self._respond(t, 'FAIL!')
+
+    def _query(self, t, q):
+        if q == 'ST':
+            st = 0
+            if self.error:
+                st |= self.ST_ERROR
+            if self._busy():
+                st |= self.ST_BUSY
+            if self._coord_queue_full():
+                st |= self.ST_COORD_FULL
+            return '%d' % st
+        if q == 'VER':
+            return self.version
+        if q == 'COORDAP':
+            return ','.join(['%d' % (int(t * 1000) & 0x7fffffff)] +
+                            ['%d' % round(self._axis_pos(a, t)) for a in self.coord_axes])
+        if q[:2] == 'AP' and q[2:] in self.axes:
+            return '%d' % round(self._axis_pos(q[2:], t))
+        return self.regs[q]
+
+    def _command(self, t, name, args):
+        n = len(self.coord_axes)
+        if name == 'ECHO':
+            self.echo = args[0]
+        elif name == 'STAMP':
+            self._respond(t, 'STAMP=%d' % args[0])
+        elif name[0] == 'R' and len(name) <= 2 and name[1:] in self.axes:
+            self.ready_waiters.append(name[1:])
+        elif name in ('PURGE', 'STOP'):
+            self._stop(t)
+            self.ready_waiters = []
+            self.error = False
+        elif name == 'RELEASE':
+            self._stop(t)
+        elif name[:7] == 'RELEASE' and name[7:] in self.axes:
+            self._release(t, name[7:])
+        elif name == 'COORDISCONT':
+            self.regs[name] = '%d' % args[0]
+        elif name in ('COORDMV', 'COORDMVT', 'COORDRELMVT'):
+            min_time = 0 if name == 'COORDMV' else args.pop(0)
+            if len(args) != n:
+                return False
+            delta = np.array(args, dtype=float)
+            if name != 'COORDRELMVT':
+                delta = delta - self.coord_trgt
+            self._queue_segment(t, delta[np.newaxis], min_time / 1000.0)
+        elif name == 'COORDSPLINET':
+            min_time, order = args[0], args[1]
+            if order < 1 or len(args) - 2 != order * n:
+                return False
+            coef = np.array(args[2:], dtype=float).reshape((n, order)).T
+            self._queue_segment(t, coef, min_time / 1000.0)
+        elif name[:2] == 'HH' and name[2:] in self.axes:
+            a = name[2:]
+            self.axis_moves[a] = (t, t + self.home_time, self._axis_pos(a, t), 0.0)
+        elif name[:1] == 'G' and name[1:] in self.axes:
+            a = name[1:]
+            p0 = self._axis_pos(a, t)
+            self.axis_moves[a] = (t, t + abs(args[0] - p0) / self._speed(a), p0, float(args[0]))
+        else:
+            self.regs[name] = ','.join('%d' % v for v in args)
+        return True
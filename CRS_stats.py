@@ -0,0 +1,179 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' Module provides per-command latency and link utilization statistics of commander. '''
+
+import collections
+import json
+import time
+
+import numpy as np
+
+
+def command_type(line):
+    """
+    Get command type of one command line.
+    :param line: Command line, e.g. 'COORDSPLINET:0,3,...' or 'ST?'.
+    :return: Command name for commands ('COORDSPLINET', 'R'), name with '?' for queries ('ST?').
+    """
+    i = line.find(':')
+    if i >= 0:
+        return line[:i]
+    return line
+
+
+def percentiles(samples):
+    """
+    Summarize samples.
+    :param samples: List of samples.
+    :return: Dictionary with count, mean, p50, p95, p99 and max of samples.
+    """
+    if not samples:
+        return {'count': 0}
+    a = np.asarray(samples, dtype=float)
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {'count': len(a), 'mean': float(a.mean()), 'p50': float(p50), 'p95': float(p95),
+            'p99': float(p99), 'max': float(a.max())}
+
+
+class CommanderStats(object):
+    """
+    Statistics collected by Commander when instrumentation is enabled: bytes and number
+    of commands per command type, round trip latency of queries, time spent blocked
+    in wait_ready and throttle_coordmv, duration of one-off phases such as robot
+    initialization and serial link utilization.
+    """
+
+    def __init__(self, baudrate=19200):
+        """
+        CommanderStats constructor.
+        :param baudrate: Configured baud rate of serial link.
+        """
+        self.baudrate = baudrate
+        self.reset()
+
+    def reset(self):
+        """
+        Clear collected statistics.
+        """
+        self.t0 = time.monotonic()
+        self.commands = collections.Counter()
+        self.bytes_sent = collections.Counter()
+        self.latency = collections.defaultdict(list)
+        self.blocked = collections.defaultdict(list)
+        self.phases = collections.defaultdict(list)
+        self.bytes_written = 0
+        self.writes = 0
+        self.bytes_saved = collections.Counter()
+
+    def command(self, cmd):
+        """
+        Account command sent by commander.
+        :param cmd: Command string, may contain several lines.
+        """
+        for line in cmd.split('\n'):
+            if line:
+                t = command_type(line)
+                self.commands[t] += 1
+                self.bytes_sent[t] += len(line) + 1
+
+    def written(self, n):
+        """
+        Account bytes written to serial interface.
+        :param n: Number of bytes.
+        """
+        self.bytes_written += n
+        self.writes += 1
+
+    def saved(self, key, n):
+        """
+        Account bytes not sent because the command was redundant.
+        :param key: Command type, e.g. 'REGMS'.
+        :param n: Number of bytes saved.
+        """
+        self.bytes_saved[key] += n
+
+    def add_latency(self, key, dt):
+        """
+        Account round trip of a query.
+        :param key: Query type, e.g. 'ST?'.
+        :param dt: Round trip time (s).
+        """
+        self.latency[key].append(dt)
+
+    def add_blocked(self, key, dt):
+        """
+        Account time spent blocked waiting for control unit.
+        :param key: Blocking function, e.g. 'wait_ready'.
+        :param dt: Blocked time (s).
+        """
+        self.blocked[key].append(dt)
+
+    def add_phase(self, key, dt):
+        """
+        Account duration of a one-off phase, which is not waiting in steady operation.
+        :param key: Phase name, e.g. 'init_robot'.
+        :param dt: Duration (s).
+        """
+        self.phases[key].append(dt)
+
+    def link_utilization(self):
+        """
+        Serial link utilization.
+        :return: Tuple of written bytes/s and its ratio to link capacity given by baud rate.
+        """
+        elapsed = time.monotonic() - self.t0
+        rate = self.bytes_written / elapsed if elapsed > 0 else 0.0
+        return rate, rate * 10.0 / self.baudrate
+
+    def summary(self):
+        """
+        Summarize collected statistics.
+        :return: Dictionary of statistics, times are in seconds.
+        """
+        rate, util = self.link_utilization()
+        return {
+            'elapsed': time.monotonic() - self.t0,
+            'baudrate': self.baudrate,
+            'bytes_written': self.bytes_written,
+            'writes': self.writes,
+            'bytes_saved': dict(self.bytes_saved),
+            'link_bytes_per_s': rate,
+            'link_utilization': util,
+            'commands': dict((t, {'count': self.commands[t], 'bytes': self.bytes_sent[t]}) for t in self.commands),
+            'latency': dict((k, percentiles(v)) for k, v in self.latency.items()),
+            'blocked': dict((k, dict(percentiles(v), total=float(np.sum(v)))) for k, v in self.blocked.items()),
+            'phases': dict((k, [float(dt) for dt in v]) for k, v in self.phases.items()),
+        }
+
+    def dump_json(self, path):
+        """
+        Write summary of statistics to JSON file.
+        :param path: Path to output file.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2, sort_keys=True)
@@ -0,0 +1,179 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' Module provides background streaming of spline segments to control unit. '''
+
+import threading
+from concurrent.futures import Future
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+_END = object()
+_STOP = object()
+
+
+class StreamCancelled(Exception):
+    """ Raised into completion future of cancelled stream. """
+
+
+class SplineStream(object):
+    """
+    Producer/consumer stream of spline segments. Feeder thread drains a bounded queue
+    of segments into Commander.splinemv, while the caller keeps producing segments.
+    Until the stream is done, other threads may only run queries such as PositionSampler
+    does: writes and reads are serialized by Commander.io_lock and a query consumes only
+    its own reply. Commands moving the robot or waiting for 'R!', 'FAIL!' or 'STAMP'
+    replies must not be issued from other threads.
+    """
+
+    def __init__(self, commander, maxsize=64, sync=True):
+        """
+        SplineStream constructor, starts feeder thread.
+        :param commander: Commander instance.
+        :param maxsize: Max number of segments waiting in the queue, put() blocks when full.
+        :param sync: Boolean, whether completion waits for the end of motion.
+        """
+        self.commander = commander
+        self.segments = queue.Queue(maxsize)
+        self.sync = sync
+        self.done = Future()
+        self.cancelled = threading.Event()
+        self.sent = 0
+        self.feeder = threading.Thread(target=self._feed, name='spline-feeder')
+        self.feeder.daemon = True
+        self.feeder.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.cancel()
+        return False
+
+    def put(self, param, order=1, min_time=None, disc=5, timeout=None):
+        """
+        Queue spline segment, blocks while the queue is full.
+        :param param: Parameters of spline movement.
+        :param order: Order of spline.
+        :param min_time: Minimal time for the movement, if None movement is carried in minimal possible time.
+        :param disc: Discontinuity of movement, internal parameter, is to be found in control unit docs.
+        :param timeout: Max time to wait for free space in the queue (s), None to wait forever.
+        """
+        while True:
+            if self.cancelled.is_set() or self.done.done():
+                raise StreamCancelled('Stream is closed.')
+            try:
+                self.segments.put((param, order, min_time, disc), timeout=0.1 if timeout is None else timeout)
+                return
+            except queue.Full:
+                if timeout is not None:
+                    raise
+
+    def close(self):
+        """
+        Mark end of stream. Completion future is resolved when all segments are sent
+        (and motion is finished if sync is set).
+        :return: Completion future.
+        """
+        if not self.cancelled.is_set():
+            self._put_marker(_END)
+        return self.done
+
+    def cancel(self, stop=True):
+        """
+        Cancel stream. Queued segments are dropped.
+        :param stop: Boolean, whether to purge the coordinated movement already sent to control unit.
+        """
+        self.cancelled.set()
+        self._drain()
+        self._put_marker(_STOP if stop else _END)
+
+    def _drain(self):
+        """
+        Drop all queued segments.
+        """
+        try:
+            while True:
+                self.segments.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _put_marker(self, marker):
+        """
+        Queue end marker, gives up when the feeder is already finished (e.g. failed).
+        :param marker: _END or _STOP.
+        """
+        while not self.done.done():
+            try:
+                self.segments.put(marker, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def wait(self, timeout=None):
+        """
+        Wait for completion of stream.
+        :param timeout: Max time to wait (s), None to wait forever.
+        :return: Number of segments sent.
+        """
+        return self.done.result(timeout)
+
+    def _feed(self):
+        c = self.commander
+        try:
+            with c.batch():
+                while True:
+                    try:
+                        item = self.segments.get(timeout=c.coordmv_queue.segment_time)
+                    except queue.Empty:
+                        # nothing to send, let already queued segments go out
+                        c.flush()
+                        continue
+                    if item is _END or item is _STOP:
+                        break
+                    if self.cancelled.is_set():
+                        continue
+                    param, order, min_time, disc = item
+                    c.splinemv(param, order=order, min_time=min_time, disc=disc)
+                    self.sent += 1
+            if self.cancelled.is_set():
+                if item is _STOP:
+                    c.reset_motors()
+                raise StreamCancelled('Stream cancelled after %d segments.' % self.sent)
+            if self.sync:
+                c.wait_ready(sync=True)
+            self.done.set_result(self.sent)
+        except BaseException as e:
+            self.done.set_exception(e)
+            # unblock producers waiting for free space, nothing will be sent anymore
+            self._drain()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+
+# Script provides host-side microbenchmarks of the commander.
+
+# Usage examples:
+# Compare response parsing cost for growing response volume: python bench.py -a parse
+# Stream spline segments to simulated control unit: python bench.py -a stream -r CRS97
+# Summarize recorded serial session: python bench.py -a log -f circle.log
+
+import argparse
+import time
+
+import numpy as np
+
+from CRS_commander import Commander
+from CRS_replay import load_log, log_summary
+from CRS_response import ResponseBuffer
+from CRS_simulator import Mars8Simulator
+from robotBosch import robotBosch
+from robotCRS import robCRS93, robCRS97
+
+
+def _chatter(n_lines, key='ST'):
+    """
+    Build response stream of a chatty control unit.
+    :param n_lines: Number of unrelated lines preceding the answer.
+    :param key: Key of the awaited answer.
+    :return: Response bytes.
+    """
+    lines = ['COORDAP=%d,-182500,252,-63625,99200,14300,-98150' % i for i in range(n_lines)]
+    lines.append('%s=%d' % (key, 0x80))
+    return ('\r\n'.join(lines) + '\r\n').encode('ascii')
+
+
+def _chunks(data, size=64):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _parse_legacy(chunks, key):
+    """ Buffer scan formerly used by Commander.query. """
+    buf = '\n'
+    for c in chunks:
+        s = c.decode('ascii').replace('\r\n', '\n').replace('\r', '\n')
+        buf += s
+        i = buf.find('\n' + key + '=')
+        if i < 0:
+            continue
+        j = buf[i + 1:].find('\n')
+        if j != -1:
+            return buf[i + 2 + len(key):i + 1 + j]
+
+
+def _parse_framed(chunks, key):
+    """ Incremental framing used by Commander.query. """
+    resp = ResponseBuffer()
+    for c in chunks:
+        resp.feed(c)
+        res = resp.take(key)
+        if res is not None:
+            return res
+
+
+def bench_parse(volumes=(250, 500, 1000, 2000, 4000, 8000), repeat=3):
+    """
+    Measure parse cost per response byte for growing response volume.
+    Cost of the framed parser shall stay flat while the legacy scan grows linearly.
+    :param volumes: Numbers of lines preceding the awaited answer.
+    :param repeat: Number of repetitions, the best time is reported.
+    """
+    print('%8s %10s %14s %14s' % ('lines', 'bytes', 'legacy ns/B', 'framed ns/B'))
+    for n in volumes:
+        data = _chatter(n)
+        chunks = _chunks(data)
+        res = []
+        for parse in (_parse_legacy, _parse_framed):
+            best = float('inf')
+            for _ in range(repeat):
+                t = time.perf_counter()
+                parse(chunks, 'ST')
+                best = min(best, time.perf_counter() - t)
+            res.append(best / len(data) * 1e9)
+        print('%8d %10d %14.1f %14.1f' % (n, len(data), res[0], res[1]))
+
+
+def sim_commander(robot, baudrate=19200, **kwargs):
+    """
+    Create commander connected to simulated control unit with initialized robot.
+    :param robot: Robot instance.
+    :param baudrate: Simulated baud rate.
+    :param kwargs: Parameters of Mars8Simulator.
+    :return: Commander instance.
+    """
+    if getattr(robot, 'REGPWRON', 0):
+        robot.REGPWRON = 0  # simulated unit has no ARM POWER button
+    commander = Commander(robot)
+    commander.set_rcon(Mars8Simulator(baudrate=baudrate, **kwargs))
+    commander.init_communication()
+    commander.init_robot()
+    commander.setup_coordmv()
+    return commander
+
+
+def bench_stream(commander, n_segments=200, min_time=20, order=3, batch=True):
+    """
+    Measure host-side cost and total time of streaming spline segments.
+    :param commander: Commander connected to control unit.
+    :param n_segments: Number of segments to stream.
+    :param min_time: Minimal time of one segment (ms).
+    :param order: Order of spline.
+    :param batch: Boolean, whether to coalesce writes.
+    """
+    dof = commander.robot.DOF
+    stats = commander.enable_stats()
+    param = np.zeros(dof * order)
+    param[0::order] = 100
+    param[1::order] = -37
+    commander.wait_ready(sync=True)
+    t0 = time.perf_counter()
+    c0 = time.process_time()
+    if batch:
+        with commander.batch():
+            for i in range(n_segments):
+                commander.splinemv(param, order=order, min_time=min_time)
+    else:
+        for i in range(n_segments):
+            commander.splinemv(param, order=order, min_time=min_time)
+    t_sent = time.perf_counter() - t0
+    c_sent = time.process_time() - c0
+    commander.wait_ready(sync=True)
+    t_total = time.perf_counter() - t0
+    print('segments %d, planned %.2f s, sent in %.2f s (host cpu %.3f s), finished in %.2f s'
+          % (n_segments, n_segments * min_time / 1000.0, t_sent, c_sent, t_total))
+    summary = stats.summary()
+    print('  writes %d, link utilization %.0f %%, blocked in throttle %.2f s, ST? latency p50 %.1f ms'
+          % (summary['writes'], summary['link_utilization'] * 100,
+             summary['blocked']['throttle_coordmv']['total'],
+             summary['latency'].get('ST?', {}).get('p50', 0.0) * 1000))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Commander host-side benchmarks')
+    parser.add_argument('-a', '--action', dest='action', type=str,
+                        default='parse', help='benchmark to run, possible actions:\n \
+                                            {parse - response parsing cost vs. response volume,\n \
+                                             stream - spline streaming to simulated control unit,\n \
+                                             log - summary of recorded serial session}')
+    parser.add_argument('-r', '--robot', dest='robot', type=str, default='CRS97',
+                        help='type of robot\n{CRS97, CRS93, Bosch}')
+    parser.add_argument('-b', '--baudrate', dest='baudrate', type=int, default=19200,
+                        help='baud rate of simulated control unit')
+    parser.add_argument('-n', '--segments', dest='segments', type=int, default=200,
+                        help='number of streamed segments')
+    parser.add_argument('-f', '--file', dest='file', type=str, default=None,
+                        help='recorded serial session')
+
+    args = parser.parse_args()
+
+    robot = None
+    if args.robot == 'CRS97':
+        robot = robCRS97()
+    if args.robot == 'CRS93':
+        robot = robCRS93()
+    if args.robot == 'Bosch':
+        robot = robotBosch()
+
+    if args.action == 'parse':
+        bench_parse()
+
+    if args.action == 'stream':
+        commander = sim_commander(robot, baudrate=args.baudrate)
+        bench_stream(commander, n_segments=args.segments, batch=False)
+        bench_stream(commander, n_segments=args.segments, batch=True)
+
+    if args.action == 'log':
+        summary = log_summary(load_log(args.file))
+        for k in sorted(summary):
+            print('%16s %s' % (k, summary[k]))
@@ -32,6 +32,7 @@ from graph import Graph
 import os
 
 from CRS_commander import Commander
+from CRS_planner import plan_stream, report_underruns
 from robotCRS import robCRS97
 from robotBosch import robotBosch
 
@@ -69,16 +70,7 @@ def rose_st(c, x0, y0, z0, f_x, f_y, cond, repeats, tl,N):
     return sol, points, lengths
 
 def points2irc(c, points):
-    prev_a = None
-    sol = np.empty((1, 4))
-    for p in points:
-        # print( cy + np.cos(a)*r, cz + np.sin(a)*r)
-        prev_a = c.find_closest_ikt(p, prev_a)
-        if prev_a is None:
-            return None, None
-        sol = np.append(sol, [prev_a], axis=0)
-    sol = np.delete(sol, 0, 0)
-    return sol
+    return c.find_ikt_path(points)
 
 
 def showBoschRose(c):
@@ -181,9 +173,10 @@ def showBoschRose(c):
         c.move_to_pos([start[0], start[1], start[2] + 8000 , start[3]])
         prev_a = c.move_to_pos(start)
         c.wait_ready(sync=True)
-        for i in range(len(params)):
-            c.splinemv(params[i], order=order, min_time=le[i+1]*10)
-            print(int(le[i+1]*10))
+        with c.batch():
+            for i in range(len(params)):
+                c.splinemv(params[i], order=order, min_time=le[i+1]*10)
+                print(int(le[i+1]*10))
         c.wait_ready(sync=True)
         c.move_to_pos([start[0], start[1], start[2] + 8000, start[3]])
         print('completed')
@@ -225,7 +218,6 @@ def draw_svg(path, blc, scale = 1.0):
     for x, y, l in zip(xs, ys, lengths):
         points = np.hstack(
             (-x[np.newaxis].T, y[np.newaxis].T, 325 * np.ones(len(x))[np.newaxis].T, np.zeros(len(x))[np.newaxis].T))
-        points2irc(c, points)
         sol = points2irc(c, points)
         params = poly.interpolate(sol)
         params_list.append(params)
@@ -239,8 +231,11 @@ def draw_svg(path, blc, scale = 1.0):
         c.move_to_pos([start[0], start[1], start[2] + 8000, start[3]])
         prev_a = c.move_to_pos(start)
         c.wait_ready(sync=True)
-        for i in range(len(params)):
-            c.splinemv(params[i], order=order, min_time=le[i+1]*1.0)
+        params, min_times, underruns = plan_stream(params, order, le[1:len(params)+1] * 1.0, c.rcon.baudrate)
+        report_underruns(underruns, min_times)
+        with c.batch():
+            for i in range(len(params)):
+                c.splinemv(params[i], order=order, min_time=min_times[i])
         c.wait_ready(sync=True)
         c.move_to_pos([end[0], end[1], end[2] + 8000, end[3]])
 
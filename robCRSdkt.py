@@ -26,6 +26,8 @@
 
 import numpy as np
 
+from robotModel import kinematic_model
+
 
 def robCRSdkt(robot, pos):
     """
@@ -34,27 +36,45 @@ def robCRSdkt(robot, pos):
     :param pos: Coordinates of robot position in joint coordinates (degrees).
     :return: Coordinates of robot position in world coordinates.
     """
-    T = np.eye(4)
-    pos = np.array(pos) / 180.0 * np.pi
-
-    for i in range(6):
-        tz = np.eye(4)
-        tz[2, 3] = robot.d[i]
-        rz = np.eye(4)
-        o = -robot.offset[i]
-        rz[:2, :2] = np.array([[np.cos(o + pos[i]), -np.sin(o + pos[i])],
-                               [np.sin(o + pos[i]), np.cos(o + pos[i])]])
-        tx = np.eye(4)
-        tx[0, 3] = robot.a[i]
-        rx = np.eye(4)
-        a = robot.alpha[i]
-        rx[1:3, 1:3] = np.array([[np.cos(a), -np.sin(a)],
-                                 [np.sin(a), np.cos(a)]])
-        T = T.dot(tz).dot(rz).dot(tx).dot(rx)
-    T = T.dot(robot.tool)
-    coord = T[:3, 3]
-    a3 = np.arctan2(T[1, 0], T[0, 0]) / np.pi * 180
-    a4 = np.arcsin(-T[2, 0]) / np.pi * 180
-    a5 = np.arctan2(T[2, 1], T[2, 2]) / np.pi * 180
-    coord = np.hstack((coord, a3, a4, a5))
+    return robCRSdkt_batch(robot, pos)[0]
+
+
+def dh_chain(robot):
+    """
+    Constant part of DH links of robot. Link i is Rz(theta_i - offset_i) * C_i, where
+    C_i = Tz(d_i) * Tx(a_i) * Rx(alpha_i) does not depend on joint angle.
+    :param robot: CRS robot instance.
+    :return: (DOF, 4, 4) constant link transformations C_i, see KinematicModel.chain.
+    """
+    return kinematic_model(robot).chain
+
+
+def robCRSdkt_batch(robot, pos, frames=False):
+    """
+    Direct kinematic task for array of configurations - robot CRS.
+    :param robot: CRS robot instance.
+    :param pos: (N, DOF) coordinates of robot positions in joint coordinates (degrees).
+    :param frames: Boolean, whether to return tool frames too.
+    :return: (N, 6) coordinates of robot positions in world coordinates, with frames=True
+             tuple of coordinates and (N, 4, 4) tool frames.
+    """
+    m = kinematic_model(robot)
+    theta = np.array(pos, dtype=float).reshape(-1, m.DOF) / 180.0 * np.pi - m.offset
+    C = m.chain
+    c, s = np.cos(theta), np.sin(theta)
+    T = None
+    for i in range(m.DOF):
+        # L = Rz(theta) * C, rotation mixes first two rows of C only
+        L = np.empty((len(theta), 4, 4))
+        L[:, 0] = c[:, i, np.newaxis] * C[i, 0] - s[:, i, np.newaxis] * C[i, 1]
+        L[:, 1] = s[:, i, np.newaxis] * C[i, 0] + c[:, i, np.newaxis] * C[i, 1]
+        L[:, 2:] = C[i, 2:]
+        T = L if T is None else np.matmul(T, L)
+    T = np.matmul(m.base, np.matmul(T, m.tool))
+    coord = np.column_stack((T[:, :3, 3],
+                             np.arctan2(T[:, 1, 0], T[:, 0, 0]) / np.pi * 180,
+                             np.arcsin(-T[:, 2, 0]) / np.pi * 180,
+                             np.arctan2(T[:, 2, 1], T[:, 2, 2]) / np.pi * 180))
+    if frames:
+        return coord, T
     return coord
@@ -25,11 +25,16 @@
 # In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
 
 
-def robCRSgripper(commander, power):
+def robCRSgripper(commander, power, block=True):
     """
     Clench/open CRS gripper.
     :param commander: Robot controller. Instance of Commander.
     :param power: Power to apply in gripper.
+    :param block: Boolean, whether to wait for open gripper. If False, the function returns
+                  immediately with future of Commander.gripper_settle and motor of open
+                  gripper is left powered, the caller sends robCRSgripperrelease from its
+                  own thread once the future is resolved.
+    :return: Future resolved with settled gripper position in non-blocking mode.
     """
 
     b = commander.robot.gripper_bounds
@@ -56,9 +61,19 @@ def robCRSgripper(commander, power):
     commander.send_cmd('G%s:%d\n' % (commander.robot.gripper_ax, pos))
 
     # Release motor of open gripper
+    if not block:
+        return commander.gripper_settle()
     if power == 0:
         commander.wait_gripper_ready()
-        commander.send_cmd('RELEASE%s:\n' % commander.robot.gripper_ax)
+        robCRSgripperrelease(commander)
+
+
+def robCRSgripperrelease(commander):
+    """
+    Release motor of CRS gripper, e.g. of open gripper after non-blocking robCRSgripper.
+    :param commander: Robot controller. Instance of Commander.
+    """
+    commander.send_cmd('RELEASE%s:\n' % commander.robot.gripper_ax)
 
 
 
@@ -68,19 +83,20 @@ def robCRSgripperinit(controller):
     :param controller: Robot controller. Instance of Commander.
     """
     m = controller.robot.gripper_ax
-    # Set  analog  mode  of controller
-    controller.send_cmd('ANAXSETUP%s:%i,%i\n' %(m, controller.robot.gripper_ADC, controller.robot.gripper_current))
-    # Maximal  curent  limit(0 - 255)
-    controller.send_cmd('REGS1%s:%i\n' % (m, controller.robot.gripper_current))
-    # Limitation  constant(feedback  from overcurrent)
-    controller.send_cmd('REGS2%s:%i\n' % (m, controller.robot.gripper_feedback))
-    # Maximal  energy  limits  voltage  on  motor
-    controller.send_cmd('REGME%s:%i\n' % (m, controller.robot.gripper_REGME))
-    # Maximal  speed
-    controller.send_cmd('REGMS%s:%i\n' % (m, controller.robot.gripper_REGMS))
-    # Axis  configuration  word
-    controller.send_cmd('REGCFG%s:%i\n' % (m, controller.robot.gripper_REGCFG))
-    # PID  parameters  of  controller
-    controller.send_cmd('REGP%s:%i\n' % (m, controller.robot.gripper_REGP))
-    controller.send_cmd('REGI%s:%i\n' % (m, controller.robot.gripper_REGI))
-    controller.send_cmd('REGD%s:%i\n' % (m, controller.robot.gripper_REGD))
+    with controller.batch():
+        # Set  analog  mode  of controller
+        controller.send_cmd('ANAXSETUP%s:%i,%i\n' %(m, controller.robot.gripper_ADC, controller.robot.gripper_current))
+        # Maximal  curent  limit(0 - 255)
+        controller.send_cmd('REGS1%s:%i\n' % (m, controller.robot.gripper_current))
+        # Limitation  constant(feedback  from overcurrent)
+        controller.send_cmd('REGS2%s:%i\n' % (m, controller.robot.gripper_feedback))
+        # Maximal  energy  limits  voltage  on  motor
+        controller.send_cmd('REGME%s:%i\n' % (m, controller.robot.gripper_REGME))
+        # Maximal  speed
+        controller.send_cmd('REGMS%s:%i\n' % (m, controller.robot.gripper_REGMS))
+        # Axis  configuration  word
+        controller.send_cmd('REGCFG%s:%i\n' % (m, controller.robot.gripper_REGCFG))
+        # PID  parameters  of  controller
+        controller.send_cmd('REGP%s:%i\n' % (m, controller.robot.gripper_REGP))
+        controller.send_cmd('REGI%s:%i\n' % (m, controller.robot.gripper_REGI))
+        controller.send_cmd('REGD%s:%i\n' % (m, controller.robot.gripper_REGD))
@@ -26,6 +26,9 @@
 
 import numpy as np
 
+from robotModel import kinematic_model
+from utils import homogeneous_inverse
+
 #  based on ROBCRSIKT by Pavel Krsek, Michal Havlena
 #  for BlueBot and Bosch Toolbox
 
@@ -37,6 +40,7 @@ def robCRSikt(robot, pos):
     :return: Coordinates of robot position in joint coordinates (degrees).
     """
     
+    m = kinematic_model(robot)
     pos = np.array(pos).astype(float)
     pos[3:] = pos[3:] / 180.0 * np.pi
 
@@ -45,71 +49,69 @@ def robCRSikt(robot, pos):
     par4 = 0 # if infinite number of solutions, theta4=par4
 
     # T = base * A01 * A12 * A23 * A34 * A45 * A56 * A76 * tool
-    A76 = np.eye(4)
-    A76[2][3] = robot.d[5]
     T = np.array([[np.cos(pos[3]) * np.cos(pos[4]), - np.sin(pos[3]) * np.cos(pos[5]) + np.cos(pos[3]) * np.sin(pos[4]) * np.sin(pos[5]),
         np.sin(pos[3]) * np.sin(pos[5]) + np.cos(pos[3]) * np.sin(pos[4]) * np.cos(pos[5]), pos[0]],
         [np.sin(pos[3]) * np.cos(pos[4]), np.cos(pos[3]) * np.cos(pos[5]) + np.sin(pos[3]) * np.sin(pos[4]) * np.sin(pos[5]),
          - np.cos(pos[3]) * np.sin(pos[5]) + np.sin(pos[3]) * np.sin(pos[4]) * np.cos(pos[5]), pos[1]],
          [- np.sin(pos[4]), np.cos(pos[4]) * np.sin(pos[5]), np.cos(pos[4]) * np.cos(pos[5]), pos[2]],
          [0, 0, 0, 1]])
-    W = np.linalg.inv(robot.base).dot(T.dot(np.linalg.inv(robot.tool).dot(np.linalg.inv(A76))))
+    W = m.base_inv.dot(T.dot(m.flange_inv))
     # X = A01 * A12 * A23 * [0 0 0 1]' because A34*A45*A57==R34*R45*R56 is pure rotation
     X = W.dot(np.array([0, 0, 0, 1])[np.newaxis].T).T[0]
 
     # solve joints 1, 2, 3
     J = []
-    b = X[2] - robot.d[0]
+    b = X[2] - m.d[0]
     if abs(X[0]) < myeps and abs(X[1]) < myeps: # arm going straight up
-        if abs(b - robot.d[3] - robot.a[1]) < myeps: # full length
+        if abs(b - m.d[3] - m.a[1]) < myeps: # full length
             J.append([par1, 0, 0])
-        elif b < robot.d[3] + robot.a[1]: # can reach
-            J.append([ par1, - np.arccos((robot.a[1] ** 2 + b ** 2 - robot.d[3] ** 2) / (2 * robot.a[1] * b)),
-            np.pi - np.arccos((robot.a[1] ** 2 + robot.d[3] ** 2 - b ** 2) / (2 * robot.a[1] * robot.d[3]))])
-            J.append([par1, np.arccos((robot.a[1] ** 2 + b ** 2 - robot.d[3] ** 2) / (2 * robot.a[1] * b)), - np.pi + np.arccos(
-            (robot.a[1] ** 2 + robot.d[3] ** 2 - b ** 2) / (2 * robot.a[1] * robot.d[3]))])
+        elif b < m.d[3] + m.a[1]: # can reach
+            J.append([ par1, - np.arccos((m.a[1] ** 2 + b ** 2 - m.d[3] ** 2) / (2 * m.a[1] * b)),
+            np.pi - np.arccos((m.a[1] ** 2 + m.d[3] ** 2 - b ** 2) / (2 * m.a[1] * m.d[3]))])
+            J.append([par1, np.arccos((m.a[1] ** 2 + b ** 2 - m.d[3] ** 2) / (2 * m.a[1] * b)), - np.pi + np.arccos(
+            (m.a[1] ** 2 + m.d[3] ** 2 - b ** 2) / (2 * m.a[1] * m.d[3]))])
         else: # cannot reach
             J = [np.nan, np.nan, np.nan]
 
     else:
         c = np.sqrt(b ** 2 + X[0] ** 2 + X[1] ** 2)
-        if abs(c - robot.d[3] - robot.a[1]) < myeps: # full length
+        if abs(c - m.d[3] - m.a[1]) < myeps: # full length
             J.append([np.arctan2(X[1], X[0]) - np.pi / 2 + np.arcsin(b / c), 0])
             J.append([np.arctan2(-X[1], -X[0]), np.pi / 2 - np.arcsin(b / c), 0])
-        elif c < robot.d[3] + robot.a[1]: # can reach
-            theta2 = np.pi / 2 - np.arcsin(b / c) + np.arccos((robot.a[1] ** 2 + c ** 2 - robot.d[3] ** 2) / (2 * robot.a[1] * c))
+        elif c < m.d[3] + m.a[1]: # can reach
+            theta2 = np.pi / 2 - np.arcsin(b / c) + np.arccos((m.a[1] ** 2 + c ** 2 - m.d[3] ** 2) / (2 * m.a[1] * c))
         # can be bigger than np.pi!!! 
             if theta2 > np.pi:
                 theta2 = theta2-2 * np.pi
 
-            J.append(np.array([np.arctan2(X[1], X[0]), - theta2, np.pi - np.arccos((robot.a[1] ** 2 + robot.d[3] ** 2 - c ** 2) / (2 * robot.a[1] * robot.d[3]))]))
-            J.append(np.array([np.arctan2(X[1], X[0]), - np.pi / 2 + np.arcsin(b / c) + np.arccos((robot.a[1] ** 2 + c ** 2 - robot.d[3] ** 2) / (2 * robot.a[1] * c)),
-            - np.pi + np.arccos((robot.a[1] ** 2 + robot.d[3] ** 2 - c ** 2) / (2 * robot.a[1] * robot.d[3]))]))
-            J.append(np.array([np.arctan2(-X[1], -X[0]), theta2, - np.pi + np.arccos((robot.a[1] ** 2 + robot.d[3] ** 2 - c ** 2) / (2 * robot.a[1] * robot.d[3]))]))
-            J.append(np.array([np.arctan2(-X[1], -X[0]), np.pi / 2 - np.arcsin(b / c) - np.arccos((robot.a[1] ** 2 + c ** 2 - robot.d[3] ** 2) / (2 * robot.a[1] * c)),
-            np.pi - np.arccos((robot.a[1] ** 2 + robot.d[3] ** 2 - c ** 2) / (2 * robot.a[1] * robot.d[3]))]))
+            J.append(np.array([np.arctan2(X[1], X[0]), - theta2, np.pi - np.arccos((m.a[1] ** 2 + m.d[3] ** 2 - c ** 2) / (2 * m.a[1] * m.d[3]))]))
+            J.append(np.array([np.arctan2(X[1], X[0]), - np.pi / 2 + np.arcsin(b / c) + np.arccos((m.a[1] ** 2 + c ** 2 - m.d[3] ** 2) / (2 * m.a[1] * c)),
+            - np.pi + np.arccos((m.a[1] ** 2 + m.d[3] ** 2 - c ** 2) / (2 * m.a[1] * m.d[3]))]))
+            J.append(np.array([np.arctan2(-X[1], -X[0]), theta2, - np.pi + np.arccos((m.a[1] ** 2 + m.d[3] ** 2 - c ** 2) / (2 * m.a[1] * m.d[3]))]))
+            J.append(np.array([np.arctan2(-X[1], -X[0]), np.pi / 2 - np.arcsin(b / c) - np.arccos((m.a[1] ** 2 + c ** 2 - m.d[3] ** 2) / (2 * m.a[1] * c)),
+            np.pi - np.arccos((m.a[1] ** 2 + m.d[3] ** 2 - c ** 2) / (2 * m.a[1] * m.d[3]))]))
         else: # cannot reach
             J = [np.nan, np.nan, np.nan]
 
 
     deg = []
     toolJ = np.eye(4)
-    toolJ[2][3] = robot.d[3]
+    toolJ[2][3] = m.d[3]
     for j in range(np.array(J).shape[0]):
         nnn = [np.isnan(a) for a in J]
         if not np.any(nnn):
             # direct kinematics for first 3 joints; inversed
-            dif = (J[j] -robot.offset[:3])
-            robot.theta = dif*robot.sign[:3]
+            dif = (J[j] -m.offset[:3])
+            theta = dif*m.sign[:3]
             P = W
             for i in range(3):
-                M = [[np.cos(robot.theta[i]), -np.sin(robot.theta[i]) * np.cos(robot.alpha[i]), np.sin(robot.theta[i]) * np.sin(robot.alpha[i]), robot.a[i] * np.cos(robot.theta[i])],
-                [np.sin(robot.theta[i]), np.cos(robot.theta[i]) * np.cos(robot.alpha[i]), -np.cos(robot.theta[i]) * np.sin(robot.alpha[i]), robot.a[i] * np.sin(robot.theta[i])],
-                [0, np.sin(robot.alpha[i]), np.cos(robot.alpha[i]), robot.d[i]],
+                M = [[np.cos(theta[i]), -np.sin(theta[i]) * m.cos_alpha[i], np.sin(theta[i]) * m.sin_alpha[i], m.a[i] * np.cos(theta[i])],
+                [np.sin(theta[i]), np.cos(theta[i]) * m.cos_alpha[i], -np.cos(theta[i]) * m.sin_alpha[i], m.a[i] * np.sin(theta[i])],
+                [0, m.sin_alpha[i], m.cos_alpha[i], m.d[i]],
                 [0, 0, 0, 1]]
-                P = np.linalg.inv(M).dot(P)
+                P = homogeneous_inverse(M).dot(P)
                 # P = R34 * R45 * R56
-            P = np.linalg.inv(toolJ).dot(P)
+            P = homogeneous_inverse(toolJ).dot(P)
 
             # Euler Z - Y Z for joints 4, 5, 6
             if abs(P[2][2] - 1) < myeps: # np.cos(theta5) == 1
@@ -126,4 +128,139 @@ def robCRSikt(robot, pos):
             deg = J + [np.nan, np.nan, np.nan]
 
     deg = np.array(deg) * 180 / np.pi
-    return deg
\ No newline at end of file
+    return deg
+
+def _pose_matrices(pos):
+    """
+    Homogeneous transformations of poses.
+    :param pos: (N, 6) poses, position and Euler angles in radians.
+    :return: (N, 4, 4) transformations.
+    """
+    c3, s3 = np.cos(pos[:, 3]), np.sin(pos[:, 3])
+    c4, s4 = np.cos(pos[:, 4]), np.sin(pos[:, 4])
+    c5, s5 = np.cos(pos[:, 5]), np.sin(pos[:, 5])
+    T = np.zeros((len(pos), 4, 4))
+    T[:, 0, 0] = c3 * c4
+    T[:, 0, 1] = -s3 * c5 + c3 * s4 * s5
+    T[:, 0, 2] = s3 * s5 + c3 * s4 * c5
+    T[:, 1, 0] = s3 * c4
+    T[:, 1, 1] = c3 * c5 + s3 * s4 * s5
+    T[:, 1, 2] = -c3 * s5 + s3 * s4 * c5
+    T[:, 2, 0] = -s4
+    T[:, 2, 1] = c4 * s5
+    T[:, 2, 2] = c4 * c5
+    T[:, :3, 3] = pos[:, :3]
+    T[:, 3, 3] = 1.0
+    return T
+
+
+def _dh_matrices(theta, d, a, ca, sa):
+    """
+    DH transformations of one joint for array of joint angles.
+    :param theta: (...) joint angles in radians.
+    :param ca: Cosine of link twist alpha.
+    :param sa: Sine of link twist alpha.
+    :return: (..., 4, 4) transformations.
+    """
+    ct, st = np.cos(theta), np.sin(theta)
+    M = np.zeros(np.shape(theta) + (4, 4))
+    M[..., 0, 0] = ct
+    M[..., 0, 1] = -st * ca
+    M[..., 0, 2] = st * sa
+    M[..., 0, 3] = a * ct
+    M[..., 1, 0] = st
+    M[..., 1, 1] = ct * ca
+    M[..., 1, 2] = -ct * sa
+    M[..., 1, 3] = a * st
+    M[..., 2, 1] = sa
+    M[..., 2, 2] = ca
+    M[..., 2, 3] = d
+    M[..., 3, 3] = 1.0
+    return M
+
+
+def robCRSikt_batch(robot, pos):
+    """
+    Inverse kinematic task for array of poses - robot CRS. Solutions are ordered as
+    in robCRSikt, 4 configurations of arm each with 2 configurations of wrist.
+    :param robot: CRS robot instance.
+    :param pos: (N, 6) coordinates of robot positions in world coordinates.
+    :return: Tuple of (N, 8, 6) joint coordinates (degrees), NaN for invalid solutions,
+             and (N, 8) boolean mask of valid solutions.
+    """
+    m = kinematic_model(robot)
+    pos = np.array(pos, dtype=float).reshape(-1, 6)
+    pos[:, 3:] = pos[:, 3:] / 180.0 * np.pi
+    n = len(pos)
+
+    myeps = 10000 * 2.2204e-16 # equality tolerance
+    par1 = 0 # if infinite number of solutions, theta1=par1
+    par4 = 0 # if infinite number of solutions, theta4=par4
+    a1, d3 = m.a[1], m.d[3]
+
+    W = np.matmul(m.base_inv, np.matmul(_pose_matrices(pos), m.flange_inv))
+    X = W[:, :3, 3]
+
+    # solve joints 1, 2, 3 for all 4 arm configurations
+    J = np.full((n, 4, 3), np.nan)
+    b = X[:, 2] - m.d[0]
+    up = (np.abs(X[:, 0]) < myeps) & (np.abs(X[:, 1]) < myeps)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # arm going straight up
+        full = up & (np.abs(b - d3 - a1) < myeps)
+        reach = up & ~full & (b < d3 + a1)
+        g = np.arccos((a1 ** 2 + b ** 2 - d3 ** 2) / (2 * a1 * b))
+        h = np.arccos((a1 ** 2 + d3 ** 2 - b ** 2) / (2 * a1 * d3))
+        J[full, 0] = [par1, 0, 0]
+        J[reach, 0] = np.column_stack((np.full(n, par1), -g, np.pi - h))[reach]
+        J[reach, 1] = np.column_stack((np.full(n, par1), g, -np.pi + h))[reach]
+
+        # general position
+        c = np.sqrt(b ** 2 + X[:, 0] ** 2 + X[:, 1] ** 2)
+        reach = ~up & (c < d3 + a1 + myeps)
+        asb = np.arcsin(b / c)
+        g = np.arccos(np.clip((a1 ** 2 + c ** 2 - d3 ** 2) / (2 * a1 * c), -1, 1))
+        h = np.arccos(np.clip((a1 ** 2 + d3 ** 2 - c ** 2) / (2 * a1 * d3), -1, 1))
+        q1 = np.arctan2(X[:, 1], X[:, 0])
+        q1r = np.arctan2(-X[:, 1], -X[:, 0])
+        theta2 = np.pi / 2 - asb + g
+        theta2[theta2 > np.pi] -= 2 * np.pi
+        general = np.stack((np.column_stack((q1, -theta2, np.pi - h)),
+                            np.column_stack((q1, -np.pi / 2 + asb + g, -np.pi + h)),
+                            np.column_stack((q1r, theta2, -np.pi + h)),
+                            np.column_stack((q1r, np.pi / 2 - asb - g, np.pi - h))), axis=1)
+        J[reach] = general[reach]
+    arm = ~np.isnan(J[:, :, 0])
+
+    # direct kinematics for first 3 joints; inversed
+    theta = (J - m.offset[:3]) * m.sign[:3]
+    A = _dh_matrices(theta[..., 0], m.d[0], m.a[0], m.cos_alpha[0], m.sin_alpha[0])
+    for i in range(1, 3):
+        A = np.matmul(A, _dh_matrices(theta[..., i], m.d[i], m.a[i], m.cos_alpha[i], m.sin_alpha[i]))
+    toolJ = np.eye(4)
+    toolJ[2][3] = m.d[3]
+    # P = R34 * R45 * R56
+    P = np.matmul(homogeneous_inverse(np.matmul(A, toolJ)), W[:, np.newaxis])
+
+    # Euler Z - Y Z for joints 4, 5, 6
+    deg = np.full((n, 4, 2, 6), np.nan)
+    deg[:, :, :, :3] = J[:, :, np.newaxis]
+    p22 = P[..., 2, 2]
+    top = np.abs(p22 - 1) < myeps # np.cos(theta5) == 1
+    bottom = np.abs(p22 + 1) < myeps # np.cos(theta5) == -1
+    regular = ~top & ~bottom
+    theta5 = np.arccos(np.clip(p22, -1, 1))
+    w = deg[:, :, 0, 3:]
+    w[...] = np.stack((np.arctan2(P[..., 1, 2], P[..., 0, 2]), -theta5,
+                       np.arctan2(P[..., 2, 1], -P[..., 2, 0])), axis=-1)
+    w[top] = np.column_stack((np.full(np.count_nonzero(top), par4), np.zeros(np.count_nonzero(top)),
+                              np.arctan2(P[..., 1, 0], P[..., 0, 0])[top] - par4))
+    w[bottom] = np.column_stack((np.full(np.count_nonzero(bottom), par4), np.full(np.count_nonzero(bottom), np.pi),
+                                 np.arctan2(P[..., 1, 0], -P[..., 0, 0])[bottom] + par4))
+    deg[:, :, 1, 3:] = np.stack((np.arctan2(-P[..., 1, 2], -P[..., 0, 2]), theta5,
+                                 np.arctan2(-P[..., 2, 1], P[..., 2, 0])), axis=-1)
+
+    mask = np.stack((arm, arm & regular), axis=-1).reshape(n, 8)
+    deg = deg.reshape(n, 8, 6) * 180 / np.pi
+    deg[~mask] = np.nan
+    return deg, mask
@@ -25,7 +25,8 @@
 # In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
 
 import numpy as np
-from robotBoschikt import robotBoschikt
+from robotBoschdkt import robotBoschdkt, robotBoschdkt_batch
+from robotBoschikt import robotBoschikt, robotBoschikt_batch
 
 #  based on BlueBot and Bosch Toolbox
 #  by  O. Certik, V. Smutny, P. Krsek, M. Matousek
@@ -58,6 +59,8 @@ class robotBosch:
         self.DOF = 4
         self.activemotors = 'ABCD'
         self.hh_axes_list = 'CABD'
+        # groups of axes homed concurrently, groups are homed in order
+        self.hh_plan = ['C', 'AB', 'D']
         self.control_axes_list = 'ABCD'
         self.coord_axes = 'ABCD'
 
@@ -98,6 +101,9 @@ class robotBosch:
         # General parameters (optional)
 
         self.ikt = robotBoschikt
+        self.ikt_batch = robotBoschikt_batch
+        self.dkt = robotBoschdkt
+        self.dkt_batch = robotBoschdkt_batch
 
         self.portname = 'COM2'  # corrected from COM4  26.3.2013 by Smutny
         self.BaudRate = 9600  # Comport baud rate (default 19200 baud)
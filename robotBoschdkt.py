@@ -0,0 +1,58 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+import numpy as np
+
+from robotModel import kinematic_model
+
+
+def robotBoschdkt(robot, pos):
+    """
+    Direct kinematic task for robot Bosch.
+    :param robot: Robot Bosch instance.
+    :param pos: Coordinates of robot position in joint coordinates (degrees).
+    :return: Coordinates of robot position in world coordinates.
+    """
+    return robotBoschdkt_batch(robot, pos)[0]
+
+
+def robotBoschdkt_batch(robot, pos):
+    """
+    Direct kinematic task for array of configurations - robot Bosch. First joint is
+    measured clockwise from y axis, second joint is angle between the arms.
+    :param robot: Robot Bosch instance.
+    :param pos: (N, 4) coordinates of robot positions in joint coordinates (degrees).
+    :return: (N, 4) coordinates of robot positions in world coordinates.
+    """
+    m = kinematic_model(robot)
+    pos = np.array(pos, dtype=float).reshape(-1, 4)
+    psi1 = (90.0 - pos[:, 0]) / 180.0 * np.pi
+    psi2 = psi1 - pos[:, 1] / 180.0 * np.pi
+    return np.column_stack((m.L1 * np.cos(psi1) + m.L2 * np.cos(psi2),
+                            m.L1 * np.sin(psi1) + m.L2 * np.sin(psi2),
+                            -pos[:, 2],
+                            pos[:, 3]))
@@ -26,6 +26,8 @@
 
 import numpy as np
 
+from robotModel import kinematic_model
+
 #  based on BlueBot and Bosch Toolbox
 #  by  O. Certik, V. Smutny, P. Krsek, M. Matousek
 
@@ -38,14 +40,15 @@ def robotBoschikt(robot, pos):
     :return: Coordinates of robot position in joint coordinates (degrees).
     """
 
+    m = kinematic_model(robot)
     pos = np.array(pos).astype(float)
     c = np.sqrt(pos[0] ** 2 + pos[1] ** 2)
-    v = (c ** 2 - robot.L1 ** 2 - robot.L2 ** 2) / (2 * robot.L1 * robot.L2)
+    v = (c ** 2 - m.L1 ** 2 - m.L2 ** 2) / (2 * m.L1 * m.L2)
     if abs(v) > 1.0:
         return []
 
     b = np.arccos(v) * 180.0 / np.pi
-    g = np.arccos((c ** 2 + robot.L1 ** 2 - robot.L2 ** 2) / (2 * robot.L1 * c)) * 180.0 / np.pi
+    g = np.arccos((c ** 2 + m.L1 ** 2 - m.L2 ** 2) / (2 * m.L1 * c)) * 180.0 / np.pi
 
     if pos[0] == 0:
         d = 90.0 * np.sign(pos[1])
@@ -66,8 +69,46 @@ def robotBoschikt(robot, pos):
         deg[:, :2] = deg[:, :2] * np.sign(pos[0])
 
     if pos[0] < 0:
-        p = deg[0, :]
+        p = deg[0, :].copy()
         deg[0, :] = deg[1, :]
         deg[1, :] = p
 
-    return deg
\ No newline at end of file
+    return deg
+
+def robotBoschikt_batch(robot, pos):
+    """
+    Inverse kinematic task for array of poses - robot Bosch. Solutions are ordered as
+    in robotBoschikt.
+    :param robot: Robot Bosch instance.
+    :param pos: (N, 4) coordinates of robot positions in world coordinates.
+    :return: Tuple of (N, 2, 4) joint coordinates (degrees), NaN for unreachable poses,
+             and (N, 2) boolean mask of valid solutions.
+    """
+    m = kinematic_model(robot)
+    pos = np.array(pos, dtype=float).reshape(-1, 4)
+    x, y = pos[:, 0], pos[:, 1]
+    c = np.sqrt(x ** 2 + y ** 2)
+    v = (c ** 2 - m.L1 ** 2 - m.L2 ** 2) / (2 * m.L1 * m.L2)
+    reachable = np.abs(v) <= 1.0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        b = np.arccos(v) * 180.0 / np.pi
+        g = np.arccos((c ** 2 + m.L1 ** 2 - m.L2 ** 2) / (2 * m.L1 * c)) * 180.0 / np.pi
+        d = np.where(x == 0, 90.0 * np.sign(y), np.arctan(y / x) * np.sign(x) * 180.0 / np.pi)
+
+    deg = np.empty((len(pos), 2, 4))
+    deg[:, :, 3] = pos[:, 3, np.newaxis]
+    deg[:, :, 2] = -pos[:, 2, np.newaxis]
+    deg[:, 0, 1] = b
+    deg[:, 0, 0] = 90.0 - d - g
+    deg[:, 1, 1] = -b
+    deg[:, 1, 0] = 90.0 - d + g
+
+    s = np.where(x != 0, np.sign(x), 1.0)
+    deg[:, :, :2] *= s[:, np.newaxis, np.newaxis]
+    swap = x < 0
+    deg[swap] = deg[swap, ::-1]
+
+    mask = np.repeat(reachable[:, np.newaxis], 2, axis=1)
+    deg[~mask] = np.nan
+    return deg, mask
@@ -28,9 +28,9 @@
 
 import numpy as np
 
-from robCRSdkt import robCRSdkt
-from robCRSgripper import robCRSgripper, robCRSgripperinit
-from robCRSikt import robCRSikt
+from robCRSdkt import robCRSdkt, robCRSdkt_batch
+from robCRSgripper import robCRSgripper, robCRSgripperinit, robCRSgripperrelease
+from robCRSikt import robCRSikt, robCRSikt_batch
 
 
 #  based on BlueBot and Bosch Toolbox
@@ -68,6 +68,8 @@ class robCRS:
         self.activemotors = 'ABCDEF'
         # axes in hh_axes_list are in order of initialization
         self.hh_axes_list = 'BACDEF'
+        # groups of axes homed concurrently, groups are homed in order
+        self.hh_plan = ['B', 'AC', 'DEF']
         self.control_axes_list = 'ABCDEF'
         self.coord_axes = 'ABCDEF'
 
@@ -141,6 +143,7 @@ class robCRS:
 
         self.gripper = robCRSgripper
         self.gripper_init = robCRSgripperinit
+        self.gripper_release = robCRSgripperrelease
 
 
         # Kind of gripper (CRSGripper, Magnetic)
@@ -175,7 +178,9 @@ class robCRS:
         self.gripper_poll_diff = 50
 
         self.ikt = robCRSikt
+        self.ikt_batch = robCRSikt_batch
         self.dkt = robCRSdkt
+        self.dkt_batch = robCRSdkt_batch
 
         self.degtoirc = np.multiply(self.direction, np.multiply(self.irc, self.gearing)) * 4.0 / 360.0
 
@@ -0,0 +1,132 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' Module provides compiled kinematic model of robot '''
+
+import weakref
+
+import numpy as np
+
+from utils import homogeneous_inverse
+
+
+def _array(robot, name):
+    """
+    Robot parameter as contiguous read-only float64 array, None if robot lacks it.
+    """
+    val = getattr(robot, name, None)
+    if val is None:
+        return None
+    val = np.ascontiguousarray(val, dtype=np.float64)
+    val.flags.writeable = False
+    return val
+
+
+class KinematicModel(object):
+    """
+    Kinematic parameters of robot instance in form used by kinematic tasks and joint
+    conversions. Parameters are read once from robot, stored as read-only float64
+    arrays together with invariants derived from them, e.g. inverses of base and tool
+    or constant parts of DH links. Attributes missing on robot (e.g. DH parameters of
+    Bosch robot) are None. Model is immutable, use kinematic_model to get the one
+    shared by robot instance.
+    """
+
+    __slots__ = ('DOF', 'L1', 'L2',
+                 'hhirc', 'hhdeg', 'degtoirc', 'irctodeg', 'bound',
+                 'd', 'a', 'alpha', 'offset', 'sign', 'cos_alpha', 'sin_alpha',
+                 'base', 'tool', 'base_inv', 'tool_inv', 'flange_inv', 'chain')
+
+    def __init__(self, robot):
+        """
+        KinematicModel constructor.
+        :param robot: Robot instance, e.g. robotBosch, robCRS97 or robCRS93.
+        """
+        s = lambda name, val: object.__setattr__(self, name, val)
+        s('DOF', int(robot.DOF))
+        s('L1', float(robot.L1))
+        s('L2', float(robot.L2))
+
+        s('hhirc', _array(robot, 'hhirc'))
+        s('hhdeg', _array(robot, 'hhdeg'))
+        s('degtoirc', _array(robot, 'degtoirc'))
+        s('bound', _array(robot, 'bound'))
+        s('irctodeg', 1.0 / self.degtoirc)
+        self.irctodeg.flags.writeable = False
+
+        for name in ('d', 'a', 'alpha', 'offset', 'sign', 'base', 'tool'):
+            s(name, _array(robot, name))
+        if self.alpha is None:
+            for name in ('cos_alpha', 'sin_alpha', 'base_inv', 'tool_inv', 'flange_inv', 'chain'):
+                s(name, None)
+            return
+
+        s('cos_alpha', np.cos(self.alpha))
+        s('sin_alpha', np.sin(self.alpha))
+        s('base_inv', homogeneous_inverse(self.base))
+        s('tool_inv', homogeneous_inverse(self.tool))
+        # inverse of last link translation followed by tool, maps tool frame to wrist
+        last = np.eye(4)
+        last[2, 3] = self.d[-1]
+        s('flange_inv', self.tool_inv.dot(homogeneous_inverse(last)))
+        # Link i is Rz(theta_i - offset_i) * C_i, C_i = Tz(d_i) * Tx(a_i) * Rx(alpha_i)
+        # does not depend on joint angle
+        chain = np.zeros((self.DOF, 4, 4))
+        chain[:, 0, 0] = 1.0
+        chain[:, 0, 3] = self.a
+        chain[:, 1, 1] = self.cos_alpha
+        chain[:, 1, 2] = -self.sin_alpha
+        chain[:, 2, 1] = self.sin_alpha
+        chain[:, 2, 2] = self.cos_alpha
+        chain[:, 2, 3] = self.d
+        chain[:, 3, 3] = 1.0
+        s('chain', chain)
+        for name in ('cos_alpha', 'sin_alpha', 'base_inv', 'tool_inv', 'flange_inv', 'chain'):
+            getattr(self, name).flags.writeable = False
+
+    def __setattr__(self, name, value):
+        raise AttributeError("KinematicModel is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("KinematicModel is immutable")
+
+
+# Models per robot instance, see kinematic_model
+_models = weakref.WeakKeyDictionary()
+
+
+def kinematic_model(robot, rebuild=False):
+    """
+    Kinematic model of robot, built on first use and shared afterwards.
+    :param robot: Robot instance, e.g. robotBosch, robCRS97 or robCRS93.
+    :param rebuild: Boolean, whether to build model again after robot parameters were changed.
+    :return: KinematicModel instance.
+    """
+    model = None if rebuild else _models.get(robot)
+    if model is None:
+        model = _models[robot] = KinematicModel(robot)
+    return model
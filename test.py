@@ -35,11 +35,25 @@
 # Show graph of circle_trajectory trajectory skip setup: python test.py -r CRS93 -s -a graph
 # Move along circle_trajectory trajectory point-to-point, skip setup: python test.py -r CRS93 -s -a circle_ptp
 # Move along circle_trajectory trajectory using interpolated trajectory, skip setup: python test.py -r CRS93 -a circle_spline
+# Run the same with simulated control unit: python test.py -r CRS93 -d sim -a circle_spline
+# Record serial session: python test.py -r CRS93 -a circle_spline --record circle.log
+# Replay recorded session without robot: python test.py -r CRS93 -a circle_spline --replay circle.log
+# Move along interpolated circle trajectory compiled into motion program: python test.py -r CRS93 -a circle_program
+# Initialize robot, skip homing when control unit kept its state: python test.py -r CRS93 --resume
+# Record position trace of the motion: python test.py -r CRS93 -d sim -a circle_spline --trace trace.npy
+# Collect per-command latency statistics: python test.py -r CRS93 -d sim -a circle_spline --stats stats.json
 
 import argparse
+import time
+
 import numpy as np
 
+from CRS_analysis import analyze, report
 from CRS_commander import Commander
+from CRS_program import compile_program
+from CRS_replay import RecordingTransport, ReplayTransport
+from CRS_sampler import PositionSampler
+from CRS_simulator import Mars8Simulator
 # from demo.im_proc import *
 from graph import Graph
 from interpolation import *
@@ -50,11 +64,16 @@ from robotCRS import robCRS93, robCRS97
 
 def move_point_to_point(trajectory, commander):
     commander.move_to_pos(trajectory[0])
-    for i in range(1, len(trajectory)):
-        commander.move_to_pos(trajectory[i])
+    # neighbouring points are close, send moves in relative form where it is shorter
+    commander.shortest_encoding = True
+    try:
+        for i in range(1, len(trajectory)):
+            commander.move_to_pos(trajectory[i])
+    finally:
+        commander.shortest_encoding = False
 
 
-def move_spline(trajectory, commander, spline, order):
+def interpolate_spline(trajectory, spline, order):
     spline_params = []
 
     if spline == 'poly':
@@ -68,12 +87,26 @@ def move_spline(trajectory, commander, spline, order):
         penalty_order = 2
         lambda_ = 0.1
         spline_params = p_spline.interpolate(trajectory, num_segments, poly_deg, penalty_order, lambda_)
+    return spline_params, order
+
+
+def move_spline(trajectory, commander, spline, order):
+    spline_params, order = interpolate_spline(trajectory, spline, order)
 
     commander.move_to_pos(trajectory[0])
     commander.wait_ready(sync=True)
+    t_start = time.monotonic()
+    stream = commander.stream()
     for i in range(len(spline_params)):
-        commander.splinemv(spline_params[i], order=order)
-    commander.wait_ready(sync=True)
+        stream.put(spline_params[i], order=order)
+    stream.close().result()
+    return spline_params, order, t_start
+
+
+def move_program(trajectory, commander, spline, order, path='trajectory.prg'):
+    spline_params, order = interpolate_spline(trajectory, spline, order)
+    compile_program(path, commander.robot.coord_axes, trajectory[0], spline_params, order=order)
+    commander.run_program(path)
 
 
 def circle_trajectory(commander, x=500, y0=250, z0=500, r=50, step=10):
@@ -87,17 +120,14 @@ def circle_trajectory(commander, x=500, y0=250, z0=500, r=50, step=10):
     :param step: angle of trajectory discretisation in degrees
     :return: points of trajectory
     """
-    pos = [x, y0 + r, z0, 0, 0, 0]
-    sol = [commander.find_closest_ikt(pos)]
     rng = int(360 / step)
-    for i in range(rng + 1):
-        y = y0 + r * np.cos((i * step) / 180.0 * np.pi)
-        z = z0 + r * np.sin((i * step) / 180.0 * np.pi)
-        pos = [x, y, z, 0, 0, 0]
-        prev_a = commander.find_closest_ikt(pos, sol[-1])
-        sol.append(prev_a)
-
-    return np.array(sol)
+    a = np.arange(rng + 1) * step / 180.0 * np.pi
+    pos = np.zeros((rng + 2, 6))
+    pos[:, 0] = x
+    pos[0, 1:3] = [y0 + r, z0]
+    pos[1:, 1] = y0 + r * np.cos(a)
+    pos[1:, 2] = z0 + r * np.sin(a)
+    return commander.find_ikt_path(pos)
 
 
 def line_trajectory(commander, x0, x1, step=5):
@@ -111,13 +141,8 @@ def line_trajectory(commander, x0, x1, step=5):
     """
     rng = int(np.linalg.norm(np.array(x0) - np.array(x1)) / step)
     normal = (np.array(x1) - np.array(x0)) / np.linalg.norm(np.array(x0) - np.array(x1))
-    x = x0
-    sol = [commander.find_closest_ikt(x)]
-    for i in range(rng):
-        x = x + normal * step
-        prev_x = commander.find_closest_ikt(x, sol[-1])
-        sol.append(prev_x)
-    return np.array(sol)
+    pos = np.array(x0) + np.arange(rng + 1)[:, np.newaxis] * normal * step
+    return commander.find_ikt_path(pos)
 
 
 if __name__ == '__main__':
@@ -128,12 +153,13 @@ if __name__ == '__main__':
     parser.add_argument('-s', '--skip-setup', dest='skip_setup', action='store_true',
                         default=False, help='skip hard-home initialization of robot')
     parser.add_argument('-d', '--tty-device', dest='tty_dev', type=str,
-                        default='/dev/ttyUSB0', help='tty line_trajectory/device to robot')
+                        default='/dev/ttyUSB0', help='tty line_trajectory/device to robot, sim for simulated control unit')
     parser.add_argument('-a', '--action', dest='action', type=str,
                         default='home', help='action to run, possible actions:\n \
                                             {home - homing of the robot,\n \
                                              graph - draw graph of interpolated circle trajectory,\n \
                                              circle_spline - move along interpolated circle trajectory,\n \
+                                             circle_program - move along interpolated circle trajectory compiled into motion program,\n \
                                              circle_ptp - move along circle trajectory point to point,\n \
                                              grip - close gripper,\n \
                                              purge - purge errors on motors}')
@@ -145,6 +171,18 @@ if __name__ == '__main__':
     parser.add_argument('-sp', '--spline', dest='spline', type=str, default='poly',
                         help='type of spline to use for interpolation\n{poly, b-spline, p-spline}')
     parser.add_argument('-o', '--order', dest='order', type=int, default=2, help='order of splines')
+    parser.add_argument('--record', dest='record', type=str, default=None,
+                        help='record serial session into file')
+    parser.add_argument('--replay', dest='replay', type=str, default=None,
+                        help='replay recorded serial session instead of connecting to control unit')
+    parser.add_argument('--fast', dest='fast', action='store_true', default=False,
+                        help='replay recorded responses as fast as possible')
+    parser.add_argument('--resume', dest='resume', action='store_true', default=False,
+                        help='skip homing when control unit kept its state since last session')
+    parser.add_argument('--trace', dest='trace', type=str, default=None,
+                        help='sample robot position during action and save it into .npy file')
+    parser.add_argument('--stats', dest='stats', type=str, default=None,
+                        help='collect per-command statistics and dump them into JSON file')
 
     args = parser.parse_args()
 
@@ -166,14 +204,33 @@ if __name__ == '__main__':
         robot = robotBosch()
 
     commander = Commander(robot)  # initialize commander
-    commander.open_comm(tty_dev, speed=19200)  # connect to control unit
+    replay = None
+    if args.replay is not None or tty_dev == 'sim':
+        if args.replay is not None:
+            rcon = replay = ReplayTransport(args.replay, realtime=not args.fast)  # replay recorded session
+        else:
+            rcon = Mars8Simulator(baudrate=19200)  # connect to simulated control unit
+        if args.record is not None:
+            rcon = RecordingTransport(rcon, args.record)
+        commander.set_rcon(rcon)
+        commander.init_communication()
+    else:
+        commander.open_comm(tty_dev, speed=19200, record=args.record)  # connect to control unit
+
+    if args.stats is not None:
+        commander.enable_stats()
 
     if not skip_setup or action == 'home':
-        commander.init(reg_type=reg_type, max_speed=max_speed, hard_home=True)
+        commander.init(reg_type=reg_type, max_speed=max_speed, hard_home=True, resume=args.resume)
+
+    sampler = None
+    if args.trace is not None:
+        sampler = PositionSampler(commander)
+        sampler.start()
 
     if rob in ['CRS97', 'CRS93']:
 
-        if action in ['graph', 'circle_ptp', 'circle_spline']:
+        if action in ['graph', 'circle_ptp', 'circle_spline', 'circle_program']:
             sol = circle_trajectory(commander)
 
             if action == 'graph':
@@ -181,7 +238,17 @@ if __name__ == '__main__':
                 e.show_gui()
 
             if action == 'circle_spline':
-                move_spline(sol, commander, spline, order)
+                spline_params, order, t_start = move_spline(sol, commander, spline, order)
+                if sampler is not None:
+                    sampler.stop()
+                    trace = sampler.snapshot()
+                    # segments are untimed, their durations follow from axis speed limits
+                    result = analyze(trace[trace[:, 0] >= t_start], spline_params, order, 0, sol[0],
+                                     speed=commander.coord_speed())
+                    report(result, commander.coord_axes)
+
+            if action == 'circle_program':
+                move_program(sol, commander, spline, order)
 
             if action == 'circle_ptp':
                 move_point_to_point(sol, commander)
@@ -192,3 +259,20 @@ if __name__ == '__main__':
 
         if action == 'purge':
             commander.send_cmd("PURGE:\n")
+
+    if sampler is not None:
+        sampler.stop()
+        sampler.save(args.trace)
+
+    if args.resume:
+        commander.save_session()
+
+    if args.stats is not None:
+        commander.stats.dump_json(args.stats)
+
+    if replay is not None:
+        if replay.mismatches:
+            print('Replay: %d mismatches, diverged from recording at byte %d.'
+                  % (replay.mismatches, replay.diverged_at))
+        else:
+            print('Replay: commands match recording.')
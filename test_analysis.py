@@ -0,0 +1,81 @@
+# Coordinated Spline Motion and Robot Control Project
+# 
+# Copyright (c) 2017 Olga Petrova <olga.petrova@cvut.cz>
+# Advisor: Pavel Pisa <pisa@cmp.felk.cvut.cz>
+# FEE CTU Prague, Czech Republic
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# In 2017, project funded by PiKRON s.r.o. http://www.pikron.com/
+
+
+''' End-to-end test of trajectory analysis on a trace recorded from simulated control unit. '''
+
+import time
+
+import numpy as np
+
+from CRS_analysis import analyze
+from CRS_commander import Commander
+from CRS_sampler import PositionSampler
+from CRS_simulator import Mars8Simulator
+from interpolation import poly
+from robotCRS import robCRS93
+
+
+def test_analyze_simulated_trace():
+    commander = Commander(robCRS93())
+    commander.set_rcon(Mars8Simulator(baudrate=19200))
+    commander.init_communication()
+    commander.init(hard_home=True)
+
+    a = np.linspace(0.0, 2 * np.pi, 37)
+    pos = np.zeros((len(a), 6))
+    pos[:, 0] = 500
+    pos[:, 1] = 250 + 50 * np.cos(a)
+    pos[:, 2] = 500 + 50 * np.sin(a)
+    sol = commander.find_ikt_path(pos)
+    params = poly.interpolate(sol)
+    order = 3
+
+    commander.move_to_pos(sol[0])
+    commander.wait_ready(sync=True)
+    t_start = time.monotonic()
+    with PositionSampler(commander) as sampler:
+        stream = commander.stream()
+        for p in params:
+            stream.put(p, order=order)
+        stream.close().result()
+    trace = sampler.snapshot()
+    trace = trace[trace[:, 0] >= t_start]
+
+    # segments are untimed, durations follow from speed limits
+    speed = commander.coord_speed()
+    result = analyze(trace, params, order, 0, sol[0], speed=speed)
+    assert abs(result['t0'] - t_start) < 0.2
+    assert abs(result['lag']) < 0.2
+    assert np.all(np.isfinite(result['rms']))
+    assert np.all(np.isfinite(result['path_rms']))
+    # tracking error is small compared to the motion
+    span = np.ptp(sol, axis=0)
+    assert np.all(result['path_rms'] < 0.1 * span)
+    # robot ends at the planned end position, up to rounding of streamed coefficients
+    commander.wait_ready()
+    _, end = commander.axis_get_pos()
+    assert np.allclose(end, sol[-1], atol=len(params))
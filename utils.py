@@ -49,4 +49,81 @@ def param_correction(start, params, order):
         pos = oldpos + np.sum(param, axis=0)
         oldpos = pos.copy()
         params[i] = np.reshape(np.round(param.T), [len(start)*order], order='C')
-    return params
\ No newline at end of file
+    return params
+
+def homogeneous_inverse(T):
+    """
+    Inverse of homogeneous transformation, closed form [R' -R'p; 0 1].
+    :param T: Homogeneous transformation(s), array of shape (..., 4, 4).
+    :return: Inverse transformation(s).
+    """
+    T = np.asarray(T, dtype=float)
+    Ti = np.zeros_like(T)
+    Rt = np.swapaxes(T[..., :3, :3], -1, -2)
+    Ti[..., :3, :3] = Rt
+    Ti[..., :3, 3] = -np.einsum('...ij,...j->...i', Rt, T[..., :3, 3])
+    Ti[..., 3, 3] = 1.0
+    return Ti
+
+
+def select_path(cand, valid, start, bound=None, margin=0.05, margin_weight=1000.0, max_step=None):
+    """
+    Select one candidate configuration per point of a path by dynamic programming (Viterbi),
+    minimizing sum of joint distances between consecutive configurations and penalty for
+    configurations closer to joint bounds than margin.
+    :param cand: (N, K, DOF) candidate configurations, e.g. IRC of all IKT solutions.
+    :param valid: (N, K) boolean mask of valid candidates.
+    :param start: Configuration the path starts from.
+    :param bound: Lower and upper joint bounds, no limit penalty if None.
+    :param margin: Distance from bound penalized, as fraction of joint range.
+    :param margin_weight: Penalty of configuration lying at joint bound, in units of joint distance.
+    :param max_step: Max change of any joint between consecutive points, None for no limit.
+    :return: Tuple of (N,) indices of selected candidates and total cost of the path.
+             ValueError is raised with index of the first point which cannot be reached.
+
+    Invalid candidates may hold NaN (e.g. missing IKT solutions of a straight wrist)
+    and never take part in a transition:
+
+    >>> nan = float('nan')
+    >>> cand = np.array([[[0.0, 0.0], [nan, nan]], [[1.0, 0.0], [nan, nan]], [[2.0, 0.0], [5.0, 5.0]]])
+    >>> valid = ~np.isnan(cand[:, :, 0])
+    >>> path, cost = select_path(cand, valid, [0.0, 0.0])
+    >>> path.tolist(), float(cost)
+    ([0, 0, 0], 2.0)
+    """
+    n, k, dof = cand.shape
+    cand = np.where(valid[:, :, np.newaxis], cand, 0.0)
+    cost = np.where(valid, 0.0, np.inf)
+    if bound is not None:
+        lo, hi = np.asarray(bound[0], dtype=float), np.asarray(bound[1], dtype=float)
+        with np.errstate(invalid='ignore'):
+            d = np.minimum(cand - lo, hi - cand) / (margin * (hi - lo))
+            penalty = np.sum(np.clip(1.0 - d, 0.0, 1.0) ** 2, axis=2)
+        cost = cost + margin_weight * np.where(valid, penalty, 0.0)
+
+    def step_cost(i):
+        delta = cand[i][np.newaxis, :, :] - cand[i - 1][:, np.newaxis, :]
+        c = np.linalg.norm(delta, axis=2)
+        if max_step is not None:
+            c[np.any(np.abs(delta) > max_step, axis=2)] = np.inf
+        return np.where(valid[i - 1][:, np.newaxis] & valid[i][np.newaxis, :], c, np.inf)
+
+    back = np.zeros((n, k), dtype=int)
+    # move to the first point is not limited by max_step
+    total = cost[0] + np.linalg.norm(cand[0] - np.asarray(start, dtype=float), axis=1)
+    if not np.any(np.isfinite(total)):
+        raise ValueError("Position 0 is unreachable!")
+    for i in range(1, n):
+        t = total[:, np.newaxis] + step_cost(i)
+        back[i] = np.argmin(t, axis=0)
+        total = t[back[i], np.arange(k)] + cost[i]
+        if not np.any(np.isfinite(total)):
+            if np.any(valid[i]):
+                raise ValueError("Position %d cannot be reached from position %d within max_step!" % (i, i - 1))
+            raise ValueError("Position %d is unreachable!" % i)
+
+    path = np.empty(n, dtype=int)
+    path[-1] = np.argmin(total)
+    for i in range(n - 1, 0, -1):
+        path[i - 1] = back[i, path[i]]
+    return path, total[path[-1]]